@@ -0,0 +1,214 @@
+# aio.py
+# asyncio-native MQTT client core.
+#
+# Drives a paho client from the asyncio event loop through paho's socket
+# callbacks (add_reader/add_writer) instead of loop_start()'s network thread,
+# so every callback runs on the loop thread and no locks or thread handoffs
+# are needed:
+#
+#     client = AsyncClient("my-service")
+#     await client.connect("127.0.0.1", 1883)
+#     await client.publish("twitter/test", b"anon_user: hello", qos=1)
+#     async with client.subscribe("twitter/#") as sub:
+#         async for msg in sub:
+#             print(msg.topic, msg.payload)
+#
+# Dependencies: pip install paho-mqtt
+
+import asyncio
+
+import paho.mqtt.client as mqtt
+
+from topics import TopicTrie
+
+MISC_INTERVAL_S = 1.0
+
+
+class MQTTError(Exception):
+    pass
+
+
+class Subscription:
+    # async context manager and async iterator over the messages matching one filter
+    def __init__(self, client, topic_filter, qos, maxsize):
+        self.client = client
+        self.topic_filter = topic_filter
+        self.qos = qos
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    async def __aenter__(self):
+        await self.client._subscribe(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client._unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    def _deliver(self, msg):
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+
+class AsyncClient:
+    def __init__(self, client_id="", clean_session=True):
+        self.client = mqtt.Client(client_id=client_id, clean_session=clean_session)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_unsubscribe = self._on_unsubscribe
+        self.client.on_message = self._on_message
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        self.loop = None
+        self.subscriptions = []
+        self.routes = TopicTrie()   # filter -> [Subscription]
+        self._connected = None
+        self._disconnected = None
+        self._misc = None
+        self._acks = {}        # mid -> future, for PUBLISH / SUBSCRIBE / UNSUBSCRIBE
+        self._early = {}       # mid -> ack value, for acks that arrive before the caller registered a future
+
+    # paho socket callbacks -> asyncio readers/writers
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self._misc = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self._misc is not None:
+            self._misc.cancel()
+            self._misc = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        # keepalive pings and retries
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(MISC_INTERVAL_S)
+
+    # paho protocol callbacks, all invoked on the loop thread
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if self._connected is not None and not self._connected.done():
+            self._connected.set_result(rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        if self._disconnected is not None and not self._disconnected.done():
+            self._disconnected.set_result(rc)
+        for fut in self._acks.values():
+            if not fut.done():
+                fut.set_exception(MQTTError(f"disconnected (rc={rc})"))
+        self._acks.clear()
+
+    def _ack(self, mid, value=None):
+        fut = self._acks.pop(mid, None)
+        if fut is None:
+            self._early[mid] = value
+        elif not fut.done():
+            fut.set_result(value)
+
+    def _on_publish(self, client, userdata, mid):
+        self._ack(mid)
+
+    def _on_subscribe(self, client, userdata, mid, granted_qos):
+        self._ack(mid, granted_qos)
+
+    def _on_unsubscribe(self, client, userdata, mid):
+        self._ack(mid)
+
+    def _on_message(self, client, userdata, msg):
+        for _, subs in self.routes.match(msg.topic):
+            for sub in subs:
+                sub._deliver(msg)
+
+    def _wait_ack(self, rc, mid):
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            raise MQTTError(mqtt.error_string(rc))
+        fut = self.loop.create_future()
+        if mid in self._early:
+            fut.set_result(self._early.pop(mid))
+        else:
+            self._acks[mid] = fut
+        return fut
+
+    # public API
+
+    async def connect(self, host, port=1883, keepalive=60):
+        self.loop = asyncio.get_running_loop()
+        self._connected = self.loop.create_future()
+        self._disconnected = self.loop.create_future()
+        # the TCP connect itself is blocking; everything after it is event-driven
+        self.client.connect(host, port, keepalive)
+        rc = await self._connected
+        if rc != 0:
+            raise MQTTError(mqtt.connack_string(rc))
+
+    async def disconnect(self):
+        self.client.disconnect()
+        if self._disconnected is not None:
+            await self._disconnected
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        # returns a future resolved when paho reports the message as published
+        # (written to the socket at QoS 0, PUBACK/PUBCOMP received at QoS 1/2);
+        # `await client.publish(...)` waits for it, fire-and-forget callers can ignore it
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        return self._wait_ack(info.rc, info.mid)
+
+    def subscribe(self, topic_filter, qos=0, maxsize=0):
+        return Subscription(self, topic_filter, qos, maxsize)
+
+    def _add_route(self, sub):
+        self.subscriptions.append(sub)
+        subs = self.routes.get(sub.topic_filter)
+        if subs is None:
+            self.routes.insert(sub.topic_filter, [sub])
+        else:
+            subs.append(sub)
+
+    def _remove_route(self, sub):
+        # returns True when no Subscription uses the filter any more
+        if sub not in self.subscriptions:
+            return False
+        self.subscriptions.remove(sub)
+        subs = self.routes.get(sub.topic_filter)
+        subs.remove(sub)
+        if subs:
+            return False
+        self.routes.remove(sub.topic_filter)
+        return True
+
+    async def _subscribe(self, sub):
+        try:
+            self._add_route(sub)
+        except ValueError as e:
+            raise MQTTError(str(e))
+        rc, mid = self.client.subscribe(sub.topic_filter, sub.qos)
+        granted = await self._wait_ack(rc, mid)
+        if granted and granted[0] == 0x80:
+            self._remove_route(sub)
+            raise MQTTError(f"subscription to {sub.topic_filter} refused")
+
+    async def _unsubscribe(self, sub):
+        # keep the broker subscription while another Subscription still uses the filter
+        if not self._remove_route(sub) or not self.client.is_connected():
+            return
+        rc, mid = self.client.unsubscribe(sub.topic_filter)
+        await self._wait_ack(rc, mid)
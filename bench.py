@@ -0,0 +1,464 @@
+# bench.py
+# Run: python bench.py                       (all stages, summary on stdout)
+#      python bench.py --output results.json --baseline bench_baseline.json
+#      python bench.py --save-baseline         (record the current numbers as the baseline)
+# Benchmarks each stage of the publish and receive paths on its own and end to end.
+# Stages that need a display (Tk) are reported as skipped when none is available.
+# Dependencies: pip install paho-mqtt
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import broker as local_broker
+import dicttool
+import publisher
+import subscriber
+from metrics import LatencyHistogram
+from topics import TopicTrie, topic_matches
+from transport import LoopbackBus, LoopbackMessage
+import wire
+from wire import decode, encode_envelope, encode_tweet
+
+# committed next to this file; its meta says which machine recorded it
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+# a result is a regression when it is this much worse than the baseline
+DEFAULT_TOLERANCE = 0.25
+
+HASHTAGS = ["#python", "  #test ", "news", "#  spaced", "#a/b/c", "#"]
+MESSAGE = "Just shipped a new release, check it out! #python #mqtt @friend " * 2
+
+
+WORDS = ("the a to and of in is it for on that this with just my you we so new today "
+         "release update check out love great thanks happy week day time good now "
+         "python mqtt code bug fix ship deploy broker tweet follow news live").split()
+TAGS = ["#python", "#mqtt", "#news", "#test", "#opensource", "#devops"]
+MENTIONS = ["@friend", "@team", "@anon_user", "@maintainer"]
+
+
+def synthetic_tweets(n, seed=0):
+    # stand-in corpus for the compression stage when no --corpus is given
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 24))]
+        words += rng.sample(TAGS, rng.randint(0, 2)) + rng.sample(MENTIONS, rng.randint(0, 1))
+        out.append(" ".join(words).capitalize())
+    return out
+
+
+class Skip(Exception):
+    pass
+
+
+def per_op(fn, n, repeat):
+    # best-of-`repeat` nanoseconds per operation; fn(n) must perform n operations, and
+    # may return the nanoseconds they took to leave its own setup out of the timing
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        took = fn(n)
+        elapsed = (time.perf_counter_ns() - started if took is None else took) / n
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def result(value, unit, higher_is_better=False, **extra):
+    return dict(value=value, unit=unit, higher_is_better=higher_is_better, **extra)
+
+
+def bench_normalize_topic(args):
+    tags = HASHTAGS * 100
+
+    def run(n):
+        normalize = publisher.normalize_topic
+        for i in range(n // len(tags)):
+            for tag in tags:
+                normalize(tag)
+
+    return {"normalize_topic": result(per_op(run, args.n, args.repeat), "ns/op")}
+
+
+def bench_routing(args):
+    # dispatching incoming topics to 1000 subscriptions: trie walk against matching every filter
+    filters = [f"twitter/tag{i}" for i in range(900)] + [f"twitter/tag{i}/+" for i in range(90)]
+    filters += [f"twitter/+/sub{i}" for i in range(9)] + ["twitter/#"]
+    trie = TopicTrie()
+    for f in filters:
+        trie.insert(f)
+    topics = [f"twitter/tag{i * 7 % 1000}" for i in range(100)] + ["twitter/tag3/sub3"]
+
+    def linear(n):
+        for i in range(n):
+            topic = topics[i % len(topics)]
+            [f for f in filters if topic_matches(f, topic)]
+
+    def walk(n):
+        for i in range(n):
+            trie.match(topics[i % len(topics)])
+
+    return {
+        "routing.linear": result(per_op(linear, max(1, args.n // 100), args.repeat), "ns/op"),
+        "routing.trie": result(per_op(walk, args.n, args.repeat), "ns/op"),
+    }
+
+
+def bench_payload(args):
+    def legacy(n):
+        for _ in range(n):
+            f"anon_user: {MESSAGE}"
+
+    def binary(n):
+        for i in range(n):
+            encode_tweet("anon_user", MESSAGE, time.time_ns(), "publisher-1", i)
+
+    return {
+        "payload.legacy": result(per_op(legacy, args.n, args.repeat), "ns/op"),
+        "payload.binary": result(per_op(binary, args.n, args.repeat), "ns/op"),
+    }
+
+
+def bench_wire(args):
+    # binary wire format against the JSON envelope and a plain JSON object with the same fields
+    sent_ns = time.time_ns()
+    formats = {
+        "binary": (
+            lambda i: encode_tweet("anon_user", MESSAGE, sent_ns, "publisher-1", i),
+            decode,
+        ),
+        "envelope": (
+            lambda i: encode_envelope(f"anon_user: {MESSAGE}", "publisher-1", sent_ns, i).encode("utf-8"),
+            decode,
+        ),
+        "json": (
+            lambda i: json.dumps({"u": "anon_user", "t": MESSAGE, "ts": sent_ns, "pid": "publisher-1", "seq": i},
+                                 separators=(",", ":")).encode("utf-8"),
+            json.loads,
+        ),
+    }
+    out = {}
+    for name, (encode, decode_fn) in formats.items():
+        samples = [encode(i) for i in range(1000)]
+
+        def run_encode(n):
+            for i in range(n):
+                encode(i)
+
+        def run_decode(n):
+            for i in range(n):
+                decode_fn(samples[i % 1000])
+
+        out[f"wire.{name}.bytes"] = result(sum(map(len, samples)) / len(samples), "bytes")
+        out[f"wire.{name}.encode"] = result(per_op(run_encode, args.n, args.repeat), "ns/op")
+        out[f"wire.{name}.decode"] = result(per_op(run_decode, args.n, args.repeat), "ns/op")
+    return out
+
+
+def bench_compression(args):
+    # bytes saved against CPU spent, dictionary trained on 90% of the corpus and measured on the rest
+    texts = dicttool.read_corpus(args.corpus) if args.corpus else synthetic_tweets(20000)
+    random.Random(0).shuffle(texts)
+    split = max(1, len(texts) // 10)
+    holdout, training = texts[:split], texts[split:]
+    dict_id = wire.register_dictionary(dicttool.train(training))
+    payloads = [encode_tweet("anon_user", t, time.time_ns(), "publisher-1", i) for i, t in enumerate(holdout)]
+    raw = sum(map(len, payloads)) / len(payloads)
+    out = {"compress.raw.bytes": result(raw, "bytes")}
+    for name, did in (("deflate", 0), ("dict", dict_id)):
+        packed = [wire.compress(p, did) for p in payloads]
+        size = sum(map(len, packed)) / len(packed)
+
+        def run_compress(n):
+            for i in range(n):
+                wire.compress(payloads[i % len(payloads)], did)
+
+        def run_decode(n):
+            for i in range(n):
+                decode(packed[i % len(packed)])
+
+        n = min(args.n, 20000)
+        out[f"compress.{name}.bytes"] = result(size, "bytes", saved_pct=round((1 - size / raw) * 100, 1))
+        out[f"compress.{name}.encode"] = result(per_op(run_compress, n, args.repeat), "ns/op")
+        out[f"compress.{name}.decode"] = result(per_op(run_decode, n, args.repeat), "ns/op")
+    return out
+
+
+def connect_client(client_id, port, on_message=None):
+    client = mqtt.Client(client_id=client_id)
+    connected = threading.Event()
+    client.on_connect = lambda c, u, f, rc: connected.set()
+    client.on_message = on_message
+    client.connect("127.0.0.1", port, 60)
+    client.loop_start()
+    if not connected.wait(5):
+        raise Skip("could not connect to the local broker")
+    return client
+
+
+def bench_publish(args):
+    srv = local_broker.run_in_thread()
+    client = connect_client("bench-pub", srv.port)
+    payload = encode_tweet("anon_user", MESSAGE, time.time_ns(), "bench-pub", 0)
+    n = min(args.n, 20000)
+
+    def run(count):
+        for _ in range(count):
+            client.publish("twitter/bench", payload)
+        # let the network thread drain so the next round starts from an empty queue
+        client.publish("twitter/bench", payload).wait_for_publish()
+
+    try:
+        return {"client.publish.qos0": result(per_op(run, n, args.repeat), "ns/op")}
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        srv.stop()
+
+
+def make_gui_app():
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        raise Skip(f"no display ({e})")
+    root.withdraw()
+    bus = LoopbackBus()
+    # the timeline store is part of the receive path; keep it, the follow list and the
+    # session topics out of the user's data dir
+    store_dir = tempfile.TemporaryDirectory(prefix="bench-store-")
+    app = subscriber.SubscriberApp(root, broker="loopback", client_factory=bus.client_factory,
+                                   store_dir=store_dir.name, follows_path=None, client_id="bench-subscriber",
+                                   session_dir=None)
+    app.store_tmp = store_dir
+    return root, app
+
+
+def cancel_after(root):
+    for after_id in root.tk.splitlist(root.tk.call("after", "info")):
+        root.after_cancel(after_id)
+
+
+def drain(app):
+    try:
+        while True:
+            app.msg_queue.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def bench_on_message(args):
+    root, app = make_gui_app()
+    # the full receive path: the topic is followed and every tweet is new to the deduper
+    app.subscribed.add("twitter/bench")
+    app.routes.insert("twitter/bench")
+    seq = itertools.count()
+
+    def run(n):
+        messages = [
+            LoopbackMessage("twitter/bench", encode_tweet(f"user{i}", MESSAGE, time.time_ns(), "bench", next(seq)))
+            for i in range(n)
+        ]
+        started = time.perf_counter_ns()
+        on_message = app.on_message
+        for message in messages:
+            on_message(None, None, message)
+        drain(app)
+        return time.perf_counter_ns() - started
+
+    try:
+        return {"on_message": result(per_op(run, args.n, args.repeat), "ns/op")}
+    finally:
+        cancel_after(root)
+        root.destroy()
+
+
+def bench_process_queue(args):
+    root, app = make_gui_app()
+    saved = subscriber.RENDER_BATCH, subscriber.RENDER_BUDGET_MS
+    out = {}
+    try:
+        # lift the time budget so the batch size is the only limit per tick
+        subscriber.RENDER_BUDGET_MS = 10_000
+        for batch in args.batch_sizes:
+            subscriber.RENDER_BATCH = batch
+            n = max(batch * 20, 5000)
+            best = None
+            for _ in range(args.repeat):
+                now = time.time_ns()
+                for i in range(n):
+                    app.msg_queue.put(("twitter/bench", f"user{i}: {MESSAGE}", now))
+                started = time.perf_counter()
+                while not app.msg_queue.empty():
+                    app.process_queue()
+                    root.update_idletasks()
+                elapsed = time.perf_counter() - started
+                cancel_after(root)
+                rate = n / elapsed
+                best = rate if best is None else max(best, rate)
+            out[f"process_queue.batch{batch}"] = result(best, "msg/s", higher_is_better=True)
+    finally:
+        subscriber.RENDER_BATCH, subscriber.RENDER_BUDGET_MS = saved
+        cancel_after(root)
+        root.destroy()
+    return out
+
+
+def bench_roundtrip(args):
+    srv = local_broker.run_in_thread()
+    latency = LatencyHistogram("roundtrip", window=args.roundtrip)
+    # keep a bounded window in flight so we measure the pipeline, not an unbounded backlog
+    window = threading.Semaphore(100)
+    done = threading.Event()
+    count = [0]
+
+    def on_message(client, userdata, msg):
+        latency.add(time.time_ns() - decode(msg.payload)[0].sent_ns)
+        window.release()
+        count[0] += 1
+        if count[0] >= args.roundtrip:
+            done.set()
+
+    sub = connect_client("bench-sub", srv.port, on_message)
+    subscribed = threading.Event()
+    sub.on_subscribe = lambda c, u, mid, granted: subscribed.set()
+    sub.subscribe("twitter/bench")
+    subscribed.wait(5)
+    pub = connect_client("bench-pub", srv.port)
+
+    started = time.perf_counter()
+    try:
+        for i in range(args.roundtrip):
+            if not window.acquire(timeout=5):
+                raise Skip("round trip stalled")
+            pub.publish("twitter/bench", encode_tweet("anon_user", MESSAGE, time.time_ns(), "bench-pub", i))
+        if not done.wait(10):
+            raise Skip("round trip did not complete")
+        elapsed = time.perf_counter() - started
+    finally:
+        for client in (pub, sub):
+            client.loop_stop()
+            client.disconnect()
+        srv.stop()
+
+    pct = latency.percentiles()
+    return {
+        "roundtrip.throughput": result(args.roundtrip / elapsed, "msg/s", higher_is_better=True),
+        "roundtrip.p50": result(pct[50], "ms"),
+        "roundtrip.p99": result(pct[99], "ms"),
+    }
+
+
+STAGES = {
+    "normalize": bench_normalize_topic,
+    "routing": bench_routing,
+    "payload": bench_payload,
+    "wire": bench_wire,
+    "compression": bench_compression,
+    "publish": bench_publish,
+    "on_message": bench_on_message,
+    "process_queue": bench_process_queue,
+    "roundtrip": bench_roundtrip,
+}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or "value" not in current:
+            continue
+        if current["higher_is_better"]:
+            worse = current["value"] < base["value"] * (1 - tolerance)
+        else:
+            worse = current["value"] > base["value"] * (1 + tolerance)
+        change = (current["value"] - base["value"]) / base["value"] * 100 if base["value"] else 0.0
+        current["baseline"] = base["value"]
+        current["change_pct"] = round(change, 1)
+        if worse:
+            current["regression"] = True
+            regressions.append(name)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Publish/receive hot path benchmarks")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    parser.add_argument("-n", type=int, default=100_000, help="operations per microbenchmark round")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per microbenchmark (best is kept)")
+    parser.add_argument("--batch-sizes", default="50,200,500,2000")
+    parser.add_argument("--corpus", help="tweet corpus for the compression stage (default: synthetic)")
+    parser.add_argument("--roundtrip", type=int, default=20_000, help="messages for the broker round trip")
+    parser.add_argument("--output", help="write machine-readable results to this JSON file")
+    parser.add_argument("--baseline", help="baseline results to flag regressions against (default: bench_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    args.batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline_path = args.baseline or DEFAULT_BASELINE
+    # an explicit --baseline that is missing is an error, not a clean run
+    if args.baseline and not args.save_baseline and not os.path.exists(baseline_path):
+        raise SystemExit(f"baseline {baseline_path} not found")
+    results = {}
+    skipped = {}
+    for stage in args.stages.split(","):
+        if stage not in STAGES:
+            raise SystemExit(f"unknown stage {stage!r}")
+        try:
+            results.update(STAGES[stage](args))
+        except Skip as e:
+            skipped[stage] = str(e)
+
+    regressions = []
+    if not args.save_baseline:
+        try:
+            with open(baseline_path, encoding="utf-8") as f:
+                regressions = compare(results, json.load(f)["results"], args.tolerance)
+        except FileNotFoundError:
+            print(f"warning: no baseline at {baseline_path}, regressions not checked "
+                  f"(record one with --save-baseline)", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "skipped": skipped,
+        "regressions": regressions,
+    }
+    for name, r in results.items():
+        line = f"{name:28} {r['value']:14.1f} {r['unit']}"
+        if "change_pct" in r:
+            line += f"  ({r['change_pct']:+.1f}% vs baseline{', REGRESSION' if r.get('regression') else ''})"
+        print(line)
+    for stage, reason in skipped.items():
+        print(f"{stage:28} skipped: {reason}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {baseline_path}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+# broker.py
+# Run: python broker.py [--host 127.0.0.1] [--port 1883]
+# Minimal asyncio MQTT 3.1.1 broker for offline testing and benchmarks.
+# Supports CONNECT, SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, PUBLISH at
+# QoS 0/1 (QoS 2 from publishers is accepted and delivered at QoS 1), retained
+# messages, last will and keepalive. Clients connecting with clean_session=0
+# keep their session while disconnected: subscriptions are kept and up to
+# OFFLINE_QUEUE QoS 1 messages are queued for them, sent after the next CONNECT,
+# whose CONNACK then has the session-present flag set. Sessions live in memory
+# only. No authentication.
+# Dependencies: none (stdlib only)
+
+import argparse
+import asyncio
+import itertools
+import threading
+
+from collections import deque
+
+from topics import topic_matches, valid_filter
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+# CONNACK return codes
+ACCEPTED = 0
+BAD_PROTOCOL = 1
+BAD_CLIENT_ID = 2
+
+# flush a subscriber's socket once this much output is buffered
+WRITE_HIGH_WATER = 256 * 1024
+# QoS 1 messages kept per disconnected persistent session; the oldest are dropped first
+OFFLINE_QUEUE = 10000
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def encode_str(s):
+    data = s.encode("utf-8") if isinstance(s, str) else s
+    return len(data).to_bytes(2, "big") + data
+
+
+def packet(ptype, body=b"", flags=0):
+    return bytes([(ptype << 4) | flags]) + encode_length(len(body)) + body
+
+
+def publish_packet(topic, payload, qos=0, retain=False, mid=0, dup=False):
+    flags = (qos << 1) | (1 if retain else 0) | (8 if dup else 0)
+    body = encode_str(topic) + (mid.to_bytes(2, "big") if qos else b"") + payload
+    return packet(PUBLISH, body, flags)
+
+
+class Reader:
+    # cursor over a packet body
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def u8(self):
+        if self.pos >= len(self.data):
+            raise ProtocolError("truncated packet")
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def u16(self):
+        if self.pos + 2 > len(self.data):
+            raise ProtocolError("truncated packet")
+        self.pos += 2
+        return int.from_bytes(self.data[self.pos - 2:self.pos], "big")
+
+    def raw(self):
+        n = self.u16()
+        if self.pos + n > len(self.data):
+            raise ProtocolError("truncated packet")
+        self.pos += n
+        return self.data[self.pos - n:self.pos]
+
+    def str(self):
+        try:
+            return self.raw().decode("utf-8")
+        except UnicodeDecodeError:
+            raise ProtocolError("invalid UTF-8 string")
+
+    def rest(self):
+        data = self.data[self.pos:]
+        self.pos = len(self.data)
+        return data
+
+    def more(self):
+        return self.pos < len(self.data)
+
+
+async def read_packet(reader):
+    header = await reader.readexactly(1)
+    length = 0
+    for shift in range(0, 28, 7):
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+    else:
+        raise ProtocolError("malformed remaining length")
+    body = await reader.readexactly(length) if length else b""
+    return header[0] >> 4, header[0] & 0x0F, body
+
+
+class Session:
+    def __init__(self, client_id, writer, keepalive, clean=True):
+        self.client_id = client_id
+        self.writer = writer
+        self.keepalive = keepalive
+        self.clean = clean
+        self.subscriptions = {}   # filter -> granted qos
+        self.will = None          # (topic, payload, qos, retain)
+        self.queued = deque(maxlen=OFFLINE_QUEUE)   # (topic, payload) while disconnected
+        self._mids = itertools.cycle(range(1, 65536))
+
+    def sub_qos(self, topic):
+        # one copy per session, at the highest QoS among its matching filters; -1 if none match
+        sub_qos = -1
+        for topic_filter, granted in self.subscriptions.items():
+            if granted > sub_qos and topic_matches(topic_filter, topic):
+                sub_qos = granted
+        return sub_qos
+
+    def next_mid(self):
+        return next(self._mids)
+
+    def send(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+
+class Broker:
+    def __init__(self, host="127.0.0.1", port=1883):
+        self.host = host
+        self.port = port
+        self.sessions = {}   # client_id -> connected Session
+        self.offline = {}    # client_id -> disconnected Session with clean_session=0
+        self.retained = {}   # topic -> (payload, qos)
+        self.server = None
+        self.loop = None
+        self._anon = itertools.count(1)
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port 0 picks a free port; report the real one
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+    def stop(self):
+        # thread-safe shutdown for a broker started with run_in_thread()
+        self.loop.call_soon_threadsafe(self._stop)
+
+    def _stop(self):
+        for session in list(self.sessions.values()):
+            session.writer.close()
+        self.close()
+
+    async def _handle(self, reader, writer):
+        session = None
+        clean_exit = False
+        try:
+            ptype, _, body = await asyncio.wait_for(read_packet(reader), 10)
+            if ptype != CONNECT:
+                return
+            session = self._connect(body, writer)
+            if session is None:
+                return
+            timeout = session.keepalive * 1.5 if session.keepalive else None
+            while True:
+                ptype, flags, body = await asyncio.wait_for(read_packet(reader), timeout)
+                if ptype == DISCONNECT:
+                    clean_exit = True
+                    return
+                await self._dispatch(session, ptype, flags, body)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ProtocolError):
+            pass
+        finally:
+            if session is not None and self.sessions.get(session.client_id) is session:
+                del self.sessions[session.client_id]
+                if not session.clean:
+                    self.offline[session.client_id] = session
+                if session.will and not clean_exit:
+                    await self._route(*session.will)
+            writer.close()
+
+    def _connect(self, body, writer):
+        r = Reader(body)
+        protocol, level = r.str(), r.u8()
+        flags, keepalive = r.u8(), r.u16()
+        client_id = r.str()
+        if (protocol, level) not in (("MQTT", 4), ("MQIsdp", 3)):
+            writer.write(packet(CONNACK, bytes([0, BAD_PROTOCOL])))
+            return None
+        if not client_id:
+            if not flags & 0x02:
+                writer.write(packet(CONNACK, bytes([0, BAD_CLIENT_ID])))
+                return None
+            client_id = f"anon-{next(self._anon)}"
+        clean = bool(flags & 0x02)
+        session = Session(client_id, writer, keepalive, clean)
+        if flags & 0x04:
+            will_topic, will_payload = r.str(), r.raw()
+            session.will = (will_topic, will_payload, (flags >> 3) & 0x03, bool(flags & 0x20))
+        # username/password are read past and ignored
+        if flags & 0x80:
+            r.str()
+        if flags & 0x40:
+            r.raw()
+
+        # a second connection with the same client ID takes over the first
+        old = self.sessions.get(client_id)
+        if old is not None:
+            old.will = None
+            old.writer.close()
+        else:
+            old = self.offline.pop(client_id, None)
+        self.sessions[client_id] = session
+        present = old is not None and not old.clean and not clean
+        writer.write(packet(CONNACK, bytes([1 if present else 0, ACCEPTED])))
+        if present:
+            session.subscriptions = old.subscriptions
+            for topic, payload in old.queued:
+                session.send(publish_packet(topic, payload, 1, False, session.next_mid()))
+        return session
+
+    async def _dispatch(self, session, ptype, flags, body):
+        r = Reader(body)
+        if ptype == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            retain = bool(flags & 0x01)
+            topic = r.str()
+            if not topic or "+" in topic or "#" in topic:
+                raise ProtocolError("invalid publish topic")
+            mid = r.u16() if qos else 0
+            payload = r.rest()
+            if qos == 1:
+                session.send(packet(PUBACK, mid.to_bytes(2, "big")))
+            elif qos == 2:
+                session.send(packet(PUBREC, mid.to_bytes(2, "big")))
+            await self._route(topic, payload, qos, retain)
+        elif ptype == PUBREL:
+            session.send(packet(PUBCOMP, body[:2]))
+        elif ptype == SUBSCRIBE:
+            mid = r.u16()
+            granted = bytearray()
+            new_filters = []
+            while r.more():
+                topic_filter, qos = r.str(), r.u8() & 0x03
+                if not valid_filter(topic_filter):
+                    granted.append(0x80)
+                    continue
+                qos = min(qos, 1)
+                session.subscriptions[topic_filter] = qos
+                granted.append(qos)
+                new_filters.append((topic_filter, qos))
+            session.send(packet(SUBACK, mid.to_bytes(2, "big") + bytes(granted)))
+            for topic_filter, qos in new_filters:
+                self._send_retained(session, topic_filter, qos)
+        elif ptype == UNSUBSCRIBE:
+            mid = r.u16()
+            while r.more():
+                session.subscriptions.pop(r.str(), None)
+            session.send(packet(UNSUBACK, mid.to_bytes(2, "big")))
+        elif ptype == PINGREQ:
+            session.send(packet(PINGRESP))
+        elif ptype in (PUBACK, PUBREC, PUBCOMP):
+            # outbound QoS 1 is fire-and-forget on the broker side
+            pass
+        else:
+            raise ProtocolError(f"unexpected packet type {ptype}")
+
+    def _send_retained(self, session, topic_filter, sub_qos):
+        for topic, (payload, qos) in self.retained.items():
+            if topic_matches(topic_filter, topic):
+                out_qos = min(qos, sub_qos)
+                session.send(publish_packet(topic, payload, out_qos, True, session.next_mid() if out_qos else 0))
+
+    async def _route(self, topic, payload, qos, retain):
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, min(qos, 1))
+            else:
+                self.retained.pop(topic, None)
+        if qos:
+            for session in self.offline.values():
+                if session.sub_qos(topic) > 0:
+                    session.queued.append((topic, payload))
+        for session in list(self.sessions.values()):
+            sub_qos = session.sub_qos(topic)
+            if sub_qos < 0:
+                continue
+            out_qos = min(qos, sub_qos)
+            session.send(publish_packet(topic, payload, out_qos, False, session.next_mid() if out_qos else 0))
+            transport = session.writer.transport
+            if transport.get_write_buffer_size() > WRITE_HIGH_WATER:
+                try:
+                    await session.writer.drain()
+                except ConnectionError:
+                    pass
+
+
+def run_in_thread(host="127.0.0.1", port=0):
+    # start a broker on a daemon thread; returns it once it is listening (broker.port is set)
+    broker = Broker(host, port)
+    ready = threading.Event()
+
+    def _run():
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(broker.start())
+        ready.set()
+        try:
+            loop.run_until_complete(broker.serve_forever())
+        except asyncio.CancelledError:
+            pass
+        # let the connection handlers see their sockets close before the loop goes away
+        loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(loop), return_exceptions=True))
+        loop.close()
+
+    threading.Thread(target=_run, name="mqtt-broker", daemon=True).start()
+    ready.wait()
+    return broker
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local MQTT 3.1.1 broker for testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    broker = Broker(args.host, args.port)
+    print(f"broker listening on {args.host}:{args.port}")
+    try:
+        asyncio.run(broker.serve_forever())
+    except KeyboardInterrupt:
+        pass
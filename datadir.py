@@ -0,0 +1,50 @@
+# datadir.py
+# The directory the apps keep their state under: client IDs, the publisher's
+# outbox, the subscriber's timeline store, follow list and session topics.
+# Set TWEETS_DATA_DIR to use another one.
+#
+# Files that only one process may write at a time (the outbox log, a timeline
+# store) are guarded by lock(), an exclusive advisory lock on a side file that
+# lives as long as the process keeps it open. A second instance that finds one
+# taken moves on to its own copy: instance_path(path, 2) is "outbox-2.log".
+# Dependencies: none (stdlib only)
+
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+DATA_DIR = os.environ.get("TWEETS_DATA_DIR", os.path.join(os.path.expanduser("~"), ".mqtt-tweets"))
+# how many instances of an app can run side by side on one data directory
+MAX_INSTANCES = 16
+
+
+class InUseError(OSError):
+    pass
+
+
+def lock(path):
+    # returns the open lock file; raises InUseError when another process holds it
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    f = open(path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        raise InUseError(f"{path} is locked by another process")
+    return f
+
+
+def instance_path(path, n):
+    # path for the n-th instance, counting from 1: outbox.log, outbox-2.log, ...
+    if n == 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{n}{ext}"
@@ -0,0 +1,109 @@
+# dedupe.py
+# Drops tweets the subscriber has already seen. Overlapping subscriptions and
+# QoS 1 redelivery both hand the same tweet over more than once.
+#
+# Tweets are keyed by their publisher-assigned message ID, or by (publisher ID,
+# sequence number) for publishers that do not set one; tweets with neither
+# (legacy text) are never treated as duplicates.
+#
+# Two structures remember keys, both bounded:
+#   - an exact LRU cache of the most recent keys, which catches the usual case
+#     of a copy arriving shortly after the original without any false positives;
+#   - a rotating Bloom filter covering a longer time window. A new generation is
+#     started when the current one is full or older than half the window, and the
+#     oldest is dropped, so keys are remembered for between half and the whole
+#     window. A key found only in the Bloom filter is a duplicate with
+#     probability 1 - FALSE_POSITIVE_RATE.
+# Dependencies: none (stdlib only)
+
+import hashlib
+import math
+import time
+from collections import OrderedDict
+
+WINDOW_S = 600
+GENERATION_CAPACITY = 100000
+FALSE_POSITIVE_RATE = 1e-6
+EXACT_CACHE = 4096
+
+
+def tweet_key(tweet):
+    # bytes identifying a tweet, or None when it carries no identity
+    if tweet.msg_id:
+        return b"m" + tweet.msg_id
+    if tweet.publisher_id is not None and tweet.seq is not None:
+        return f"s{tweet.publisher_id}\0{tweet.seq}".encode("utf-8")
+    return None
+
+
+class BloomFilter:
+    # all generations share one size, so a key's bit positions are computed once
+    # and probed in each of them
+    def __init__(self, capacity, fp_rate):
+        self.bits = max(64, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, key):
+        # double hashing over two 64-bit halves of one digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.bits
+        return [(h1 + i * h2) % m for i in range(self.hashes)]
+
+    def add(self, positions):
+        array = self.array
+        for p in positions:
+            array[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def contains(self, positions):
+        array = self.array
+        for p in positions:
+            if not array[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+
+class Deduper:
+    # not thread-safe; the subscriber only calls it from the MQTT network thread
+    def __init__(self, window_s=WINDOW_S, capacity=GENERATION_CAPACITY,
+                 fp_rate=FALSE_POSITIVE_RATE, exact=EXACT_CACHE, clock=time.monotonic):
+        self.generation_s = window_s / 2
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.clock = clock
+        self.generations = [BloomFilter(capacity, fp_rate)]
+        self.started = clock()
+        self.exact = OrderedDict()
+        self.exact_size = exact
+        self.suppressed = 0
+
+    def _rotate(self):
+        now = self.clock()
+        if self.generations[-1].count < self.capacity and now - self.started < self.generation_s:
+            return
+        self.generations.append(BloomFilter(self.capacity, self.fp_rate))
+        del self.generations[:-2]
+        self.started = now
+
+    def seen(self, key):
+        # True when key was seen before (and counts it as suppressed); otherwise remembers it
+        if key is None:
+            return False
+        if key in self.exact:
+            self.exact.move_to_end(key)
+            self.suppressed += 1
+            return True
+        self._rotate()
+        positions = self.generations[-1].positions(key)
+        if any(g.contains(positions) for g in self.generations):
+            self.suppressed += 1
+            return True
+        self.generations[-1].add(positions)
+        self.exact[key] = None
+        if len(self.exact) > self.exact_size:
+            self.exact.popitem(last=False)
+        return False
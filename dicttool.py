@@ -0,0 +1,117 @@
+# dicttool.py
+# Run: python dicttool.py train corpus.txt [--size 16384]
+#      python dicttool.py list
+# Trains and versions the preset dictionaries used for tweet compression (wire.py).
+# The corpus is one tweet per line; tab-separated lines (e.g. the sink's --output
+# file) use their last column. Dictionaries are written to dicts/ as
+# tweets-v<version>-<id>.zdict, where <id> is the dictionary ID carried on the wire.
+# Dependencies: none (stdlib only)
+
+import argparse
+import glob
+import os
+import random
+import re
+from collections import Counter
+
+import wire
+
+DEFAULT_SIZE = 16 * 1024
+MAX_NGRAM = 3
+# share of the corpus held back to measure the trained dictionary
+HOLDOUT = 0.1
+
+_VERSION_RE = re.compile(r"tweets-v(\d+)-([0-9a-f]+)\.zdict$")
+
+
+def read_corpus(path):
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return [line.rstrip("\n").split("\t")[-1] for line in f if line.strip()]
+
+
+def train(texts, size=DEFAULT_SIZE):
+    # Score word n-grams by the bytes a back-reference would save across the corpus
+    # and keep the best ones that fit. deflate reaches nearer bytes more cheaply,
+    # so the most valuable pieces go at the end of the dictionary.
+    counts = Counter()
+    for text in texts:
+        words = text.split()
+        for n in range(1, MAX_NGRAM + 1):
+            for i in range(len(words) - n + 1):
+                counts[" ".join(words[i:i + n])] += 1
+    scored = sorted(((c - 1) * len(g), g) for g, c in counts.items() if c > 1 and len(g) > 3)
+
+    chosen = []
+    used = 0
+    for score, gram in reversed(scored):
+        if used + len(gram) + 1 > size:
+            continue
+        chosen.append(gram)
+        used += len(gram) + 1
+    chosen.reverse()
+    return " ".join(chosen).encode("utf-8")[:size]
+
+
+def evaluate(texts, dict_id):
+    # (raw bytes, compressed bytes) over binary-encoded tweets
+    raw = packed = 0
+    for text in texts:
+        payload = wire.encode_tweet(None, text)
+        raw += len(payload)
+        packed += len(wire.compress(payload, dict_id))
+    return raw, packed
+
+
+def installed(directory=wire.DICT_DIR):
+    out = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.zdict"))):
+        m = _VERSION_RE.search(os.path.basename(path))
+        if m:
+            out.append((int(m.group(1)), int(m.group(2), 16), path))
+    return out
+
+
+def cmd_train(args):
+    texts = read_corpus(args.corpus)
+    if len(texts) < 10:
+        raise SystemExit("corpus too small")
+    random.Random(0).shuffle(texts)
+    split = max(1, int(len(texts) * HOLDOUT))
+    holdout, training = texts[:split], texts[split:]
+
+    data = train(training, args.size)
+    dict_id = wire.register_dictionary(data)
+    version = max((v for v, _, _ in installed(args.dir)), default=0) + 1
+    os.makedirs(args.dir, exist_ok=True)
+    path = os.path.join(args.dir, f"tweets-v{version:04d}-{dict_id:08x}.zdict")
+    with open(path, "wb") as f:
+        f.write(data)
+
+    raw, plain = evaluate(holdout, 0)
+    _, trained = evaluate(holdout, dict_id)
+    print(f"wrote {path} ({len(data)} bytes, id {dict_id:#010x}) from {len(training)} tweets")
+    print(f"held-out {len(holdout)} tweets: raw {raw} B, deflate {plain} B ({plain / raw:.1%}), "
+          f"with dictionary {trained} B ({trained / raw:.1%})")
+
+
+def cmd_list(args):
+    for version, dict_id, path in installed(args.dir):
+        print(f"v{version:<4} id {dict_id:#010x}  {os.path.getsize(path):6} B  {path}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train and manage tweet compression dictionaries")
+    parser.add_argument("--dir", default=wire.DICT_DIR, help="dictionary directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("train", help="train a new dictionary version from a corpus")
+    p.add_argument("corpus")
+    p.add_argument("--size", type=int, default=DEFAULT_SIZE, help="dictionary size in bytes (max 32768)")
+    p.set_defaults(func=cmd_train)
+    p = sub.add_parser("list", help="list installed dictionaries")
+    p.set_defaults(func=cmd_list)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.func(args)
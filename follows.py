@@ -0,0 +1,165 @@
+# follows.py
+# Keeps the broker's subscriptions in line with the subscriber's follow list.
+#
+# sync(desired) diffs the desired topic filters against the ones the broker
+# session is believed to hold and sends the difference as multi-topic
+# SUBSCRIBE and UNSUBSCRIBE packets, each capped at MAX_FILTERS_PER_PACKET
+# filters and MAX_PACKET_BYTES, so following thousands of hashtags costs a few
+# dozen packets rather than one round trip per topic. SUBACKs are matched to
+# their packets by message ID; a filter counts as held once sent and is
+# dropped again if the broker refuses it (return code 0x80), so the next sync
+# retries it. Progress, per filter acknowledged, is reported through
+# on_progress(done, total, refused) from the MQTT thread.
+#
+# Separately from held, acked is the set the broker has confirmed: filters
+# granted by a SUBACK, minus those removed by an UNSUBACK. It is what a restart
+# can rely on the session holding. on_acked(filters) gets a copy each time it
+# changes, so the app can save it and pass it back as held next time; it is
+# called with the lock held, so saves land in order, and must not call back in.
+#
+# After a reconnect, reconnected(session_present) forgets everything held when
+# the session is new, and otherwise only the packets still unacknowledged,
+# whose fate is unknown; the following sync resends just those.
+#
+# sync() runs from both the Tk thread (follow changes) and the MQTT thread
+# (on_connect), so send_lock serializes whole syncs: a second one only diffs
+# once the first has recorded what it sent, and never sends the same filters.
+# Dependencies: a paho-mqtt compatible client (see transport.py)
+
+import threading
+
+MAX_FILTERS_PER_PACKET = 100
+MAX_PACKET_BYTES = 16 * 1024
+
+MQTT_ERR_SUCCESS = 0
+SUBACK_FAILURE = 0x80
+
+
+def chunk_filters(filters, max_filters=MAX_FILTERS_PER_PACKET, max_bytes=MAX_PACKET_BYTES):
+    # splits filters into lists that fit one packet: each filter costs its UTF-8
+    # length, a 2-byte length prefix and a QoS byte, on top of the 2-byte message ID
+    chunk = []
+    size = 2
+    for f in filters:
+        cost = len(f.encode("utf-8")) + 3
+        if chunk and (len(chunk) >= max_filters or size + cost > max_bytes):
+            yield chunk
+            chunk = []
+            size = 2
+        chunk.append(f)
+        size += cost
+    if chunk:
+        yield chunk
+
+
+class FollowManager:
+    def __init__(self, client, qos=1, held=(), on_progress=None, on_acked=None,
+                 max_filters=MAX_FILTERS_PER_PACKET, max_bytes=MAX_PACKET_BYTES):
+        self.client = client
+        self.qos = qos
+        self.on_progress = on_progress
+        self.on_acked = on_acked
+        self.max_filters = max_filters
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()   # held across a whole sync(), see above
+        self.held = set(held)    # filters the broker session is believed to hold
+        self.acked = set(held)   # filters the broker has acknowledged holding
+        self.pending = {}        # mid -> (subscribe?, [filters]) awaiting SUBACK/UNSUBACK
+        self.early = {}          # mid -> granted QoS list, for acks that beat subscribe() returning
+        self.refused = []        # filters the broker refused since the last sync started
+        self.done = 0
+        self.total = 0
+        self.packets = 0
+
+    def reconnected(self, session_present):
+        with self.lock:
+            if not session_present:
+                self.held.clear()
+                if self.acked:
+                    self.acked.clear()
+                    self._save_acked()
+            else:
+                for subscribe, filters in self.pending.values():
+                    if subscribe:
+                        self.held.difference_update(filters)
+                    else:
+                        self.held.update(filters)
+            self.pending.clear()
+            self.early.clear()
+
+    def sync(self, desired):
+        # returns (filters subscribed, filters unsubscribed) by this call
+        with self.send_lock:
+            with self.lock:
+                add = sorted(set(desired) - self.held)
+                drop = sorted(self.held - set(desired))
+                if not self.pending:
+                    self.done = self.total = 0
+                    self.refused = []
+            added = dropped = 0
+            for chunk in chunk_filters(add, self.max_filters, self.max_bytes):
+                rc, mid = self.client.subscribe([(f, self.qos) for f in chunk])
+                if rc != MQTT_ERR_SUCCESS:
+                    break
+                added += len(chunk)
+                self._sent(mid, True, chunk)
+            for chunk in chunk_filters(drop, self.max_filters, self.max_bytes):
+                rc, mid = self.client.unsubscribe(chunk)
+                if rc != MQTT_ERR_SUCCESS:
+                    break
+                dropped += len(chunk)
+                self._sent(mid, False, chunk)
+            return added, dropped
+
+    def _sent(self, mid, subscribe, filters):
+        with self.lock:
+            if subscribe:
+                self.held.update(filters)
+            else:
+                self.held.difference_update(filters)
+            self.total += len(filters)
+            self.packets += 1
+            if mid not in self.early:
+                self.pending[mid] = (subscribe, filters)
+                return
+            progress = self._acked(subscribe, filters, self.early.pop(mid))
+        self._report(progress)
+
+    def _acked(self, subscribe, filters, granted):
+        # called with the lock held; returns the progress to report once it is released
+        if subscribe:
+            for f, q in zip(filters, granted):
+                if q == SUBACK_FAILURE:
+                    self.held.discard(f)
+                    self.refused.append(f)
+                else:
+                    self.acked.add(f)
+        else:
+            self.acked.difference_update(filters)
+        self._save_acked()
+        self.done += len(filters)
+        return self.done, self.total, list(self.refused)
+
+    def _save_acked(self):
+        if self.on_acked is not None:
+            self.on_acked(set(self.acked))
+
+    def _report(self, progress):
+        if self.on_progress is not None:
+            self.on_progress(*progress)
+
+    def _ack(self, mid, granted):
+        with self.lock:
+            entry = self.pending.pop(mid, None)
+            if entry is None:
+                self.early[mid] = granted
+                return
+            progress = self._acked(entry[0], entry[1], granted)
+        self._report(progress)
+
+    def on_subscribe(self, client, userdata, mid, granted_qos):
+        self._ack(mid, granted_qos)
+
+    def on_unsubscribe(self, client, userdata, mid):
+        self._ack(mid, ())
@@ -0,0 +1,52 @@
+# metrics.py
+# Rolling latency histograms shared by the publisher and subscriber
+
+import threading
+from collections import deque
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    # keeps the most recent `window` samples (nanoseconds); percentiles are computed on demand
+    def __init__(self, name, window=4096):
+        self.name = name
+        self.count = 0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, ns):
+        with self._lock:
+            self._samples.append(max(0, ns))
+            self.count += 1
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self.count = 0
+
+    def percentiles(self, ps=PERCENTILES):
+        # returns {p: milliseconds}, or an empty dict when there are no samples yet
+        with self._lock:
+            data = sorted(self._samples)
+        if not data:
+            return {}
+        last = len(data) - 1
+        return {p: data[min(last, int(round(p / 100.0 * last)))] / 1e6 for p in ps}
+
+    def summary(self):
+        pct = self.percentiles()
+        if not pct:
+            return f"{self.name}: -"
+        return f"{self.name}: " + " / ".join(f"p{p} {ms:.1f}" for p, ms in pct.items()) + " ms"
+
+    def snapshot(self):
+        with self._lock:
+            samples = list(self._samples)
+        return {
+            "name": self.name,
+            "count": self.count,
+            "window": len(samples),
+            "percentiles_ms": {f"p{p}": ms for p, ms in self.percentiles().items()},
+            "samples_ms": [ns / 1e6 for ns in samples],
+        }
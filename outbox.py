@@ -0,0 +1,194 @@
+# outbox.py
+# Disk-backed outbox for the publisher: every tweet is logged before it is sent
+# and stays in the log until the broker acknowledges it, so a dropped link or a
+# crash does not lose posts. Unacked entries are replayed on reconnect and on the
+# next start (see PublisherApp in publisher.py).
+#
+# The log is append-only, one record per event:
+#
+#   record  <u32 length> <u32 crc32 of body> <body>
+#   body    01 <u64 id> <u8 qos> <u8 text> <u16 topic length> <topic> <payload>   tweet added
+#           02 <u64 id>                                                          tweet acked
+#
+# Records are written to the OS as they happen; fsync is batched (sync()), so a
+# power loss can drop at most the tweets of the last sync interval, a process
+# crash none. A torn record at the tail is cut off on open. Once acked records
+# outnumber live ones the log is compacted: live entries are rewritten to a new
+# file that atomically replaces the old one.
+#
+# One process owns a log at a time: opening it takes the lock on <log>.lock (see
+# datadir.py) and raises InUseError if another one holds it, since two writers
+# would hand out the same entry IDs. open_outbox() falls back to a per-instance
+# log instead (outbox-2.log, ...), which that instance replays on its next start.
+# Dependencies: none (stdlib only)
+
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+from datadir import DATA_DIR, MAX_INSTANCES, InUseError, instance_path, lock
+
+DEFAULT_PATH = os.path.join(DATA_DIR, "outbox.log")
+
+# compact once this many dead records have piled up and they outnumber live entries
+COMPACT_MIN_DEAD = 1000
+
+REC_ADD = 1
+REC_ACK = 2
+
+_HEADER = struct.Struct("<II")
+_ADD = struct.Struct("<BQBBH")
+_ACK = struct.Struct("<BQ")
+
+
+class Outbox:
+    # add() and ack() may be called from different threads (ack comes from paho's
+    # network thread via on_publish), so the log is lock-protected
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.owner = lock(path + ".lock")
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # id -> (topic, qos, payload); payload is str for text tweets
+        self.dead = 0                  # records in the file that compaction would drop
+        self.dirty = False
+        self.next_id = 1
+        self.file = None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        if self.dead:
+            self._compact()
+        else:
+            self.file = open(self.path, "ab")
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        pos = 0
+        while pos + _HEADER.size <= len(data):
+            length, crc = _HEADER.unpack_from(data, pos)
+            body = data[pos + _HEADER.size:pos + _HEADER.size + length]
+            if len(body) < length or zlib.crc32(body) != crc or not body:
+                break
+            self._apply(body)
+            pos += _HEADER.size + length
+        if pos < len(data):
+            # torn write from a crash; drop it so new records start on a boundary
+            with open(self.path, "r+b") as f:
+                f.truncate(pos)
+
+    def _apply(self, body):
+        if body[0] == REC_ADD:
+            _, entry_id, qos, is_text, n = _ADD.unpack_from(body)
+            start = _ADD.size
+            topic = body[start:start + n].decode("utf-8")
+            payload = body[start + n:]
+            self.entries[entry_id] = (topic, qos, payload.decode("utf-8") if is_text else payload)
+            self.next_id = max(self.next_id, entry_id + 1)
+        elif body[0] == REC_ACK:
+            _, entry_id = _ACK.unpack_from(body)
+            # the add and its ack are both dead
+            if self.entries.pop(entry_id, None) is not None:
+                self.dead += 2
+            else:
+                self.dead += 1
+
+    @staticmethod
+    def _add_record(entry_id, topic, qos, payload):
+        t = topic.encode("utf-8")
+        is_text = isinstance(payload, str)
+        data = payload.encode("utf-8") if is_text else bytes(payload)
+        return _ADD.pack(REC_ADD, entry_id, qos, is_text, len(t)) + t + data
+
+    def _write(self, f, body):
+        f.write(_HEADER.pack(len(body), zlib.crc32(body)) + body)
+
+    def add(self, topic, payload, qos=0):
+        # returns the entry ID, the token to ack() once the broker has the tweet
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self._write(self.file, self._add_record(entry_id, topic, qos, payload))
+            self.file.flush()
+            self.entries[entry_id] = (topic, qos, payload)
+            self.dirty = True
+            return entry_id
+
+    def ack(self, entry_ids):
+        with self.lock:
+            for entry_id in entry_ids:
+                if entry_id is None or self.entries.pop(entry_id, None) is None:
+                    continue
+                self._write(self.file, _ACK.pack(REC_ACK, entry_id))
+                self.dead += 2
+            self.file.flush()
+            self.dirty = True
+            if self.dead >= COMPACT_MIN_DEAD and self.dead > len(self.entries):
+                self._compact()
+
+    def sync(self):
+        # batched fsync; the publisher calls this on a timer
+        with self.lock:
+            if not self.dirty:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    def pending(self):
+        # unacked entries in the order they were added: [(id, topic, qos, payload)]
+        with self.lock:
+            return [(entry_id, *entry) for entry_id, entry in self.entries.items()]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _compact(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            for entry_id, (topic, qos, payload) in self.entries.items():
+                self._write(f, self._add_record(entry_id, topic, qos, payload))
+            f.flush()
+            os.fsync(f.fileno())
+        if self.file is not None:
+            self.file.close()
+        os.replace(tmp, self.path)
+        _fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+        self.file = open(self.path, "ab")
+        self.dead = 0
+        self.dirty = False
+
+    def close(self):
+        self.sync()
+        with self.lock:
+            self.file.close()
+        self.owner.close()
+
+
+def open_outbox(path=DEFAULT_PATH):
+    # the first outbox no other process has open: path, then its per-instance variants
+    for n in range(1, MAX_INSTANCES + 1):
+        try:
+            return Outbox(instance_path(path, n))
+        except InUseError:
+            continue
+    raise InUseError(f"all {MAX_INSTANCES} outboxes at {path} are in use")
+
+
+def _fsync_dir(directory):
+    # makes the rename durable; directories cannot be opened this way on Windows
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
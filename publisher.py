@@ -1,28 +1,229 @@
 # publisher.py
 # Run: python publisher.py
+#      python publisher.py --load --clients 8 --rate 2000 --duration 30   (headless load generator)
+#      python publisher.py --topic-qos "#news=2,#chat=0" --window 20          (GUI with per-topic QoS)
+#      python publisher.py --outbox ""                                        (GUI without the offline outbox)
+#      python publisher.py --clean-session                                    (GUI without a persistent session)
 # Dependencies: pip install paho-mqtt
 
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 import paho.mqtt.client as mqtt
+import argparse
+import asyncio
+import itertools
+import os
 import threading
 import time
+from collections import deque
+
+from aio import AsyncClient, MQTTError
+from datadir import InUseError
+from metrics import LatencyHistogram
+from outbox import DEFAULT_PATH as OUTBOX_PATH, open_outbox
+from reconnect import Reconnector, client_id_for
+from status import StatusChannel, flap_summary, format_event
+from tkwake import TkWaker
+from wire import compress, encode_batch, encode_tweet, load_dictionaries
 
 BROKER = "test.mosquitto.org"
 PORT = 1883
 KEEPALIVE = 60
 
+# batching publish mode: tweets for one topic are sent together once BATCH_LINGER_MS
+# has passed since the first one, or earlier when the batch reaches a size cap
+BATCH_LINGER_MS = 20
+BATCH_MAX_BYTES = 64 * 1024
+BATCH_MAX_COUNT = 500
+
+# GUI publish pipeline: QoS for topics without their own setting, max unacked MQTT
+# messages (paho's in-flight and queue limits follow it), and how long a message may
+# stay unacked before it is counted as failed
+DEFAULT_QOS = 1
+INFLIGHT_WINDOW = 20
+ACK_TIMEOUT_S = 30
+INFLIGHT_REFRESH_MS = 250
+
+# size of the random message ID attached to each tweet
+MSG_ID_BYTES = 8
+
+# outbox (see outbox.py): fsync interval, and how fast unacked tweets are replayed
+# after a reconnect; replay also waits for room in the in-flight window
+OUTBOX_SYNC_MS = 200
+REPLAY_RATE = 100
+REPLAY_INTERVAL_MS = 100
+
 def normalize_topic(raw_hashtag: str) -> str:
     tag = raw_hashtag.strip()
     if tag.startswith("#"):
         tag = tag[1:].strip()
-    if not tag:
+    # wildcards are for subscribing; a topic containing them cannot be published to
+    if not tag or "+" in tag or "#" in tag:
         return ""
     return f"twitter/{tag}"
 
+def make_client(client_id, clean_session=True):
+    return mqtt.Client(client_id=client_id, clean_session=clean_session)
+
+class TweetBatcher:
+    # Collects payloads per (topic, qos) and hands each batch to send(topic, qos, batch_payload, tokens).
+    # schedule(delay_s, fn) arms the linger timer, so the same batcher works with
+    # root.after in the GUI and loop.call_later in the asyncio load generator.
+    # Not thread-safe: add() and the timer must run on the same thread.
+    def __init__(self, send, schedule, linger_ms=BATCH_LINGER_MS,
+                 max_bytes=BATCH_MAX_BYTES, max_count=BATCH_MAX_COUNT):
+        self.send = send
+        self.schedule = schedule
+        self.linger_s = linger_ms / 1000.0
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.pending = {}   # (topic, qos) -> ([payloads], [tokens], bytes)
+        self.batches_sent = 0
+
+    def add(self, topic, payload, token=None, qos=0):
+        key = (topic, qos)
+        if key not in self.pending:
+            self.pending[key] = ([], [], 0)
+            self.schedule(self.linger_s, lambda: self.flush(key))
+        payloads, tokens, size = self.pending[key]
+        payloads.append(payload)
+        tokens.append(token)
+        size += len(payload)
+        self.pending[key] = (payloads, tokens, size)
+        if size >= self.max_bytes or len(payloads) >= self.max_count:
+            self.flush(key)
+
+    def flush(self, key):
+        # flushing a batch that was already sent (size cap hit before the timer) is a no-op
+        entry = self.pending.pop(key, None)
+        if entry is None:
+            return
+        payloads, tokens, _ = entry
+        topic, qos = key
+        self.batches_sent += 1
+        self.send(topic, qos, payloads[0] if len(payloads) == 1 else encode_batch(payloads), tokens)
+
+    def flush_all(self):
+        for key in list(self.pending):
+            self.flush(key)
+
+def parse_topic_qos(spec: str) -> dict:
+    # "#news=2,#chat=0" -> {"twitter/news": 2, "twitter/chat": 0}
+    out = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        tag, _, qos = item.rpartition("=")
+        topic = normalize_topic(tag)
+        if not topic or qos.strip() not in ("0", "1", "2"):
+            raise ValueError(f"bad topic QoS entry: {item!r}")
+        out[topic] = int(qos)
+    return out
+
+class InflightTable:
+    # Published messages by MQTT message ID until paho reports them done (on_publish:
+    # written out at QoS 0, PUBACK/PUBCOMP at QoS 1/2). Each message carries the
+    # tokens of its tweets (outbox entry IDs), handed to on_ack(tokens) once it is
+    # done. Counts are in tweets, the window is in MQTT messages. ack() runs on
+    # paho's network thread, everything else on the Tk thread, so the table is
+    # lock-protected.
+    def __init__(self, window=INFLIGHT_WINDOW, timeout_s=ACK_TIMEOUT_S, on_ack=None):
+        self.window = window
+        self.timeout_ns = int(timeout_s * 1e9)
+        self.on_ack = on_ack
+        self.lock = threading.Lock()
+        self.entries = {}     # mid -> (topic, qos, tokens, perf_counter_ns at send)
+        self.early = set()    # mids acked before track() saw them
+        self.expired = set()  # mids given up on; a late ack for them is ignored
+        self.pending = self.acked = self.failed = 0
+        self.latency = LatencyHistogram("ack")
+
+    def full(self, extra=0):
+        with self.lock:
+            return len(self.entries) + extra >= self.window
+
+    def room(self):
+        with self.lock:
+            return self.window - len(self.entries)
+
+    def track(self, info, topic, qos, tokens=(None,)):
+        # info is the MQTTMessageInfo returned by publish(); returns False when the
+        # message was refused outright and its tweets were counted as failed
+        lost = info.rc == mqtt.MQTT_ERR_QUEUE_SIZE or (info.rc != mqtt.MQTT_ERR_SUCCESS and qos == 0)
+        with self.lock:
+            if lost:
+                self.failed += len(tokens)
+                return False
+            # at QoS 1/2 paho keeps the message while disconnected and sends it on reconnect
+            early = info.mid in self.early
+            if early:
+                self.early.discard(info.mid)
+                self.acked += len(tokens)
+            else:
+                self.entries[info.mid] = (topic, qos, tokens, time.perf_counter_ns())
+                self.pending += len(tokens)
+        if early:
+            self.latency.add(0)
+            if self.on_ack is not None:
+                self.on_ack(tokens)
+        return True
+
+    def ack(self, mid):
+        now = time.perf_counter_ns()
+        with self.lock:
+            entry = self.entries.pop(mid, None)
+            if entry is None:
+                if mid in self.expired:
+                    self.expired.discard(mid)
+                else:
+                    self.early.add(mid)
+                return
+            tokens = entry[2]
+            self.pending -= len(tokens)
+            self.acked += len(tokens)
+        self.latency.add(now - entry[3])
+        if self.on_ack is not None:
+            self.on_ack(tokens)
+
+    def _fail(self, mids):
+        failed = 0
+        for mid in mids:
+            failed += len(self.entries.pop(mid)[2])
+            self.expired.add(mid)
+        self.pending -= failed
+        self.failed += failed
+        return failed
+
+    def expire(self):
+        # counts messages unacked for longer than the timeout as failed; returns how many tweets
+        deadline = time.perf_counter_ns() - self.timeout_ns
+        with self.lock:
+            return self._fail([mid for mid, entry in self.entries.items() if entry[3] < deadline])
+
+    def fail_qos0(self):
+        # paho drops unsent QoS 0 messages on disconnect; they will never be acked
+        with self.lock:
+            return self._fail([mid for mid, entry in self.entries.items() if entry[1] == 0])
+
+    def tokens(self):
+        with self.lock:
+            return {t for entry in self.entries.values() for t in entry[2]}
+
+    def counts(self):
+        with self.lock:
+            return self.pending, self.acked, self.failed, len(self.entries)
+
 class PublisherApp:
-    def __init__(self, root):
+    def __init__(self, root, broker=BROKER, port=PORT, client_factory=make_client,
+                 topic_qos=None, default_qos=DEFAULT_QOS, window=INFLIGHT_WINDOW, outbox_path=OUTBOX_PATH,
+                 client_id=None, clean_session=False):
+        # client_factory(client_id, clean_session) returns a paho-compatible client, see transport.py
         self.root = root
+        self.broker = broker
+        self.port = port
+        # topic -> QoS; changed from the QoS menu for the topic currently in the hashtag field
+        self.topic_qos = dict(topic_qos or {})
+        self.default_qos = default_qos
         root.title("MQTT Tweet Publisher")
 
         frame = tk.Frame(root, padx=10, pady=10)
@@ -37,21 +238,77 @@ class PublisherApp:
         self.hashtag_entry = tk.Entry(frame, width=40)
         self.hashtag_entry.grid(row=1, column=1, padx=6, pady=4)
         self.hashtag_entry.insert(0, "#test")
+        self.hashtag_entry.bind("<FocusOut>", lambda e: self.show_topic_qos())
+        self.hashtag_entry.bind("<Return>", lambda e: self.show_topic_qos())
 
         tk.Label(frame, text="Tweet message:").grid(row=2, column=0, sticky="nw")
         self.tweet_text = scrolledtext.ScrolledText(frame, width=50, height=6, wrap=tk.WORD)
         self.tweet_text.grid(row=2, column=1, padx=6, pady=4)
 
+        options = tk.Frame(frame)
+        options.grid(row=3, column=0, sticky="w")
+        # send the binary wire format with a send timestamp and publisher ID so subscribers
+        # can measure latency; unchecked sends the legacy "username: message" text
+        self.meta_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(options, text="Attach send metadata", variable=self.meta_var).pack(anchor="w")
+        # collect tweets per topic for a short window and send them as one MQTT message
+        self.batch_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(options, text="Batch tweets", variable=self.batch_var).pack(anchor="w")
+        # deflate binary payloads with the newest trained dictionary from dicts/ (see dicttool.py)
+        self.compress_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(options, text="Compress", variable=self.compress_var).pack(anchor="w")
+        self.dict_id = load_dictionaries() or 0
+        qos_row = tk.Frame(options)
+        qos_row.pack(anchor="w")
+        tk.Label(qos_row, text="QoS for topic:").pack(side=tk.LEFT)
+        self.qos_var = tk.IntVar(value=default_qos)
+        tk.OptionMenu(qos_row, self.qos_var, 0, 1, 2, command=self.set_topic_qos).pack(side=tk.LEFT)
+
         self.publish_btn = tk.Button(frame, text="Publish Tweet", command=self.publish_tweet, width=20)
         self.publish_btn.grid(row=3, column=1, sticky="e", padx=6, pady=6)
 
         self.status_label = tk.Label(frame, text="Disconnected", fg="red")
         self.status_label.grid(row=4, column=0, columnspan=2, sticky="w", pady=(6,0))
+        self.inflight_label = tk.Label(frame, text="", anchor="w")
+        self.inflight_label.grid(row=5, column=0, columnspan=2, sticky="w")
+        tk.Button(frame, text="Connection log", command=self.show_connection_log).grid(row=4, column=1, sticky="e")
+
+        # status updates come from the MQTT thread too; the Tk thread applies the latest per key
+        self.status = StatusChannel()
+        self.status_waker = TkWaker(root, self.apply_status)
+        self.status.notify = self.status_waker.wake
+        self.replay_requested = False
 
         # MQTT client
-        self.client = mqtt.Client(client_id=f"publisher-{int(time.time())}")
+        self.publisher_id = f"publisher-{int(time.time())}"
+        self.seq = itertools.count()
+        # the MQTT client ID stays the same across restarts so the broker can keep the session
+        self.client = client_factory(client_id or client_id_for("publisher"), clean_session)
         self.client.on_connect = self.on_connect
         self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+        # keep paho's own queue bounded; the app stops accepting tweets before it fills
+        self.inflight = InflightTable(window, on_ack=self.on_acked)
+        self.client.max_inflight_messages_set(window)
+        self.client.max_queued_messages_set(window)
+        self._inflight_scheduled = False
+        # tweets are logged here before sending and dropped once acked; None disables it.
+        # Another publisher may have the log open, then this one gets a log of its own
+        self.outbox = None
+        if outbox_path:
+            try:
+                self.outbox = open_outbox(outbox_path)
+            except InUseError as e:
+                self.update_status(f"Outbox disabled: {e}", error=True)
+            else:
+                if self.outbox.path != outbox_path:
+                    self.update_status(f"Outbox in use by another publisher; using {self.outbox.path}", error=False)
+        self.replay_queue = deque()
+        self._replay_id = None
+        self._sync_scheduled = False
+        self.show_topic_qos()
+
+        self.batcher = TweetBatcher(self.send_batch, lambda delay, fn: self.root.after(int(delay * 1000), fn))
 
         # start mqtt in background thread
         self.connect_in_thread()
@@ -59,27 +316,122 @@ class PublisherApp:
         root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def connect_in_thread(self):
-        def _connect():
-            try:
-                self.client.connect(BROKER, PORT, KEEPALIVE)
-                self.client.loop_start()
-            except Exception as e:
-                self.update_status(f"Connect error: {e}", error=True)
-        threading.Thread(target=_connect, daemon=True).start()
+        # connects, and reconnects with jittered backoff, on a thread of its own
+        self.reconnector = Reconnector(self.client, self.broker, self.port, KEEPALIVE, on_retry=self.on_retry)
+        self.reconnector.start()
+
+    def on_retry(self, delay, attempt, error):
+        reason = f"Connect error: {error}" if error else "Connection lost"
+        self.update_status(f"{reason}; retry {attempt} in {delay:.1f}s", error=True, key="connection")
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            self.update_status(f"Connected to {BROKER}:{PORT}", error=False)
+            # the replay itself runs on the Tk thread, see apply_status
+            self.replay_requested = True
+            resumed = " (session resumed)" if flags.get("session present") else ""
+            self.update_status(f"Connected to {self.broker}:{self.port}{resumed}", error=False, key="connection")
         else:
-            self.update_status(f"Connect failed (rc={rc})", error=True)
+            self.update_status(f"Connect failed (rc={rc})", error=True, key="connection")
 
     def on_disconnect(self, client, userdata, rc):
-        self.update_status("Disconnected", error=True)
+        self.update_status("Disconnected", error=True, key="connection")
+        # unsent QoS 0 messages are gone; their outbox entries get replayed instead
+        self.inflight.fail_qos0()
+
+    def on_publish(self, client, userdata, mid):
+        self.inflight.ack(mid)
+
+    def on_acked(self, tokens):
+        if self.outbox is not None:
+            self.outbox.ack(tokens)
+
+    def start_replay(self):
+        # resend outbox entries that are not already in flight (paho resends its
+        # own QoS 1/2 messages after a reconnect), REPLAY_RATE per second at most
+        if self.outbox is None:
+            return
+        if self._replay_id is not None:
+            self.root.after_cancel(self._replay_id)
+            self._replay_id = None
+        in_flight = self.inflight.tokens()
+        self.replay_queue = deque(e for e in self.outbox.pending() if e[0] not in in_flight)
+        if self.replay_queue:
+            self.update_status(f"Replaying {len(self.replay_queue)} tweet(s) from the outbox", error=False)
+            self.replay_step()
+
+    def replay_step(self):
+        self._replay_id = None
+        if not self.client.is_connected():
+            return
+        burst = min(max(1, REPLAY_RATE * REPLAY_INTERVAL_MS // 1000),
+                    self.inflight.room() - len(self.batcher.pending))
+        while burst > 0 and self.replay_queue:
+            entry_id, topic, qos, payload = self.replay_queue.popleft()
+            self.send_batch(topic, qos, payload, [entry_id])
+            burst -= 1
+        if self.replay_queue:
+            self._replay_id = self.root.after(REPLAY_INTERVAL_MS, self.replay_step)
+
+    def schedule_sync(self):
+        if self.outbox is not None and not self._sync_scheduled:
+            self._sync_scheduled = True
+            self.root.after(OUTBOX_SYNC_MS, self.sync_outbox)
+
+    def sync_outbox(self):
+        self._sync_scheduled = False
+        self.outbox.sync()
+
+    def show_topic_qos(self):
+        topic = normalize_topic(self.hashtag_entry.get())
+        self.qos_var.set(self.topic_qos.get(topic, self.default_qos))
+
+    def set_topic_qos(self, qos):
+        topic = normalize_topic(self.hashtag_entry.get())
+        if topic:
+            self.topic_qos[topic] = int(qos)
+
+    def refresh_inflight(self):
+        self._inflight_scheduled = False
+        expired = self.inflight.expire()
+        if expired:
+            self.update_status(f"{expired} tweet(s) not acknowledged within {ACK_TIMEOUT_S}s", error=True)
+        pending, acked, failed, messages = self.inflight.counts()
+        text = f"Pending {pending} · acked {acked} · failed {failed}"
+        if self.outbox is not None:
+            text += f" · outbox {len(self.outbox)}"
+        if acked:
+            text += f" · {self.inflight.latency.summary()}"
+        self.inflight_label.config(text=text, fg="orange" if messages >= self.inflight.window else "black")
+        if messages:
+            self.schedule_inflight()
+        # picks up ack records written since the last sync
+        self.schedule_sync()
+
+    def schedule_inflight(self):
+        if not self._inflight_scheduled:
+            self._inflight_scheduled = True
+            self.root.after(INFLIGHT_REFRESH_MS, self.refresh_inflight)
+
+    def update_status(self, text, error=False, key="activity"):
+        # safe from any thread
+        self.status.post(key, text, error)
 
-    def update_status(self, text, error=False):
-        def _update():
-            self.status_label.config(text=text, fg="red" if error else "green")
-        self.root.after(0, _update)
+    def apply_status(self):
+        if self.replay_requested:
+            self.replay_requested = False
+            self.start_replay()
+        changed = self.status.take()
+        if changed:
+            latest = changed[-1]
+            self.status_label.config(text=latest.text, fg="red" if latest.error else "green")
+
+    def show_connection_log(self):
+        win = tk.Toplevel(self.root)
+        win.title(f"Connection log ({flap_summary(self.status)})")
+        log = scrolledtext.ScrolledText(win, width=80, height=20)
+        log.pack(fill=tk.BOTH, expand=True)
+        log.insert(tk.END, "\n".join(format_event(s) for s in self.status.events()) or "No connection events yet")
+        log.config(state=tk.DISABLED)
 
     def publish_tweet(self):
         username = self.username_entry.get().strip()
@@ -97,26 +449,280 @@ class PublisherApp:
             messagebox.showwarning("Empty hashtag", "Please enter a hashtag/topic (e.g. #python).")
             return
 
-        payload = f"{username}: {message}"
-        try:
-            rc = self.client.publish(topic, payload)
-            # rc is MQTTMessageInfo object — we can check rc.rc for status in paho >= 1.6
-            self.update_status(f"Published to {topic}", error=False)
-            # optionally clear message field
+        # backpressure: refuse new tweets while the window is full (open batches
+        # count too, each becomes one message); the text stays in the box for a retry
+        if self.inflight.full(len(self.batcher.pending)):
+            self.update_status(f"Waiting for acks ({self.inflight.window} messages in flight), try again shortly", error=True)
+            self.schedule_inflight()
+            return
+
+        qos = self.topic_qos.get(topic, self.default_qos)
+        if self.meta_var.get():
+            # a random message ID lets subscribers drop repeated deliveries (see dedupe.py)
+            payload = encode_tweet(username, message, time.time_ns(), self.publisher_id, next(self.seq),
+                                   os.urandom(MSG_ID_BYTES))
+        else:
+            payload = f"{username}: {message}"
+        entry_id = None
+        if self.outbox is not None:
+            entry_id = self.outbox.add(topic, payload, qos)
+            self.schedule_sync()
+            if not self.client.is_connected():
+                # sent by the replay after the next connect
+                self.update_status(f"Offline: saved to outbox ({len(self.outbox)} unsent)", error=True)
+                self.tweet_text.delete("1.0", tk.END)
+                self.schedule_inflight()
+                return
+        if self.batch_var.get():
+            self.batcher.add(topic, payload, token=entry_id, qos=qos)
+            self.update_status(f"Queued for {topic}", error=False)
             self.tweet_text.delete("1.0", tk.END)
+            return
+        try:
+            info = self.client.publish(topic, self.maybe_compress(payload), qos=qos)
+            if self.inflight.track(info, topic, qos, [entry_id]):
+                self.update_status(f"Published to {topic} (QoS {qos})", error=False)
+                # optionally clear message field
+                self.tweet_text.delete("1.0", tk.END)
+            elif self.outbox is not None:
+                self.update_status(f"Publish failed: {mqtt.error_string(info.rc)}; kept in outbox", error=True)
+                self.tweet_text.delete("1.0", tk.END)
+            else:
+                self.update_status(f"Publish failed: {mqtt.error_string(info.rc)}", error=True)
         except Exception as e:
+            # publish() only raises for tweets it can never send, so do not replay them
+            self.on_acked([entry_id])
             messagebox.showerror("Publish error", f"Failed to publish: {e}")
             self.update_status(f"Publish error: {e}", error=True)
+        self.schedule_inflight()
+
+    def send_batch(self, topic, qos, payload, tokens):
+        try:
+            info = self.client.publish(topic, self.maybe_compress(payload), qos=qos)
+            if self.inflight.track(info, topic, qos, tokens):
+                self.update_status(f"Published {len(tokens)} tweet(s) to {topic} (QoS {qos})", error=False)
+            else:
+                self.update_status(f"Publish failed: {mqtt.error_string(info.rc)}", error=True)
+        except Exception as e:
+            self.on_acked(tokens)
+            self.update_status(f"Publish error: {e}", error=True)
+        self.schedule_inflight()
+
+    def maybe_compress(self, payload):
+        # only binary payloads can be compressed; legacy text goes out as-is
+        if self.compress_var.get() and isinstance(payload, bytes):
+            return compress(payload, self.dict_id)
+        return payload
 
     def on_close(self):
         try:
-            self.client.loop_stop()
-            self.client.disconnect()
+            self.batcher.flush_all()
+            self.reconnector.close()
         except Exception:
             pass
+        # unacked tweets stay in the outbox for the next start
+        if self.outbox is not None:
+            self.outbox.close()
+        self.status_waker.close()
         self.root.destroy()
 
+class LoadStats:
+    # counters shared by all load workers; the reporter swaps them out every interval
+    def __init__(self):
+        self.sent = self.acked = self.errors = 0
+        self.total_sent = self.total_acked = self.total_errors = 0
+        self.ack_latency = LatencyHistogram("ack")
+        self.total_ack_latency = LatencyHistogram("ack", window=65536)
+
+    def on_sent(self):
+        self.sent += 1
+        self.total_sent += 1
+
+    def on_error(self):
+        self.errors += 1
+        self.total_errors += 1
+
+    def on_ack(self, latency_ns):
+        self.acked += 1
+        self.total_acked += 1
+        self.ack_latency.add(latency_ns)
+        self.total_ack_latency.add(latency_ns)
+
+    def take_interval(self):
+        counts = (self.sent, self.acked, self.errors)
+        self.sent = self.acked = self.errors = 0
+        hist, self.ack_latency = self.ack_latency, LatencyHistogram("ack")
+        return counts, hist
+
+
+class LoadWorker:
+    # one client connection publishing round-robin over topics, sizes and QoS levels;
+    # all workers share one asyncio loop (see aio.py), so no locks are needed
+    def __init__(self, index, args, topics, sizes, qos_levels, stats):
+        self.args = args
+        self.stats = stats
+        self.client_id = f"loadgen-{os.getpid()}-{index}"
+        self.username = f"load{index}"
+        combos = [(t, s, q) for t in topics for s in sizes for q in qos_levels]
+        start = index % len(combos)
+        self.plan = itertools.cycle(combos[start:] + combos[:start])
+        self.fillers = {s: ("x" * s) for s in sizes}
+        self.seq = itertools.count()
+        # per-client share of the target rate; 0 means as fast as possible
+        self.interval = args.clients / args.rate if args.rate > 0 else 0.0
+        self.client = AsyncClient(self.client_id)
+        self.client.client.max_inflight_messages_set(args.max_pending)
+        self.client.client.max_queued_messages_set(args.max_pending)
+        self.window = None
+        self.batcher = None
+        self.dict_id = (load_dictionaries() or 0) if args.compress else None
+        self.stopping = False
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(self.client.connect(self.args.broker, self.args.port, KEEPALIVE), 10)
+        except (OSError, MQTTError, asyncio.TimeoutError):
+            self.stats.on_error()
+            return
+        # bound the number of unacked messages, also in as-fast-as-possible mode
+        self.window = asyncio.Semaphore(self.args.max_pending)
+        if self.args.batch:
+            self.batcher = TweetBatcher(self.send_batch, loop.call_later, self.args.linger_ms,
+                                        self.args.batch_bytes, self.args.batch_count)
+        next_send = loop.time()
+        try:
+            while True:
+                if self.interval:
+                    delay = next_send - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_send += self.interval
+                await self.window.acquire()
+                self.publish_one()
+        finally:
+            # messages still in flight at shutdown are not counted as errors
+            self.stopping = True
+            if self.client.client.is_connected():
+                # tweets still lingering in the batcher go out ahead of the DISCONNECT
+                if self.batcher is not None:
+                    self.batcher.flush_all()
+                await self.client.disconnect()
+
+    def publish_one(self):
+        topic, size, qos = next(self.plan)
+        payload = encode_tweet(self.username, self.fillers[size], time.time_ns(), self.client_id, next(self.seq))
+        sent = time.perf_counter_ns()
+        if self.batcher is not None:
+            self.batcher.add(topic, payload, token=sent, qos=qos)
+            return
+        self.send_batch(topic, qos, payload, [sent])
+
+    def send_batch(self, topic, qos, payload, tokens):
+        # tokens are the send times of the tweets carried by this message
+        if self.dict_id is not None:
+            payload = compress(payload, self.dict_id)
+        try:
+            ack = self.client.publish(topic, payload, qos=qos)
+        except Exception:
+            for _ in tokens:
+                self.stats.on_error()
+                self.window.release()
+            return
+        # a tweet counts as sent once the message carrying it is handed to the client
+        for _ in tokens:
+            self.stats.on_sent()
+        ack.add_done_callback(lambda fut: self.on_ack(fut, tokens))
+
+    def on_ack(self, fut, tokens):
+        now = time.perf_counter_ns()
+        failed = fut.cancelled() or fut.exception() is not None
+        for sent in tokens:
+            self.window.release()
+            if not failed:
+                self.stats.on_ack(now - sent)
+            elif not self.stopping:
+                self.stats.on_error()
+
+
+async def _run_load(args, topics, sizes, qos_levels):
+    stats = LoadStats()
+    workers = [LoadWorker(i, args, topics, sizes, qos_levels, stats) for i in range(args.clients)]
+    tasks = [asyncio.create_task(w.run()) for w in workers]
+    started = time.monotonic()
+    try:
+        while args.duration <= 0 or time.monotonic() - started < args.duration:
+            await asyncio.sleep(args.report_interval)
+            (sent, acked, errors), hist = stats.take_interval()
+            per_s = 1.0 / args.report_interval
+            print(f"[{time.monotonic() - started:6.1f}s] sent {sent * per_s:9.1f}/s  acked {acked * per_s:9.1f}/s  "
+                  f"errors {errors * per_s:6.1f}/s  {hist.summary()}")
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    elapsed = time.monotonic() - started
+    print(f"total: sent {stats.total_sent} ({stats.total_sent / elapsed:.1f}/s), "
+          f"acked {stats.total_acked}, errors {stats.total_errors} ({stats.total_errors / elapsed:.2f}/s), "
+          f"{stats.total_ack_latency.summary()}")
+
+
+def run_load(args):
+    topics = [t for t in (normalize_topic(h) for h in args.hashtags.split(",")) if t]
+    sizes = [int(s) for s in args.sizes.split(",")]
+    qos_levels = [int(q) for q in args.qos.split(",")]
+    if not topics:
+        raise SystemExit("no valid hashtags given")
+    if any(q not in (0, 1, 2) for q in qos_levels):
+        raise SystemExit("QoS levels must be 0, 1 or 2")
+
+    print(f"load: {args.clients} clients -> {args.broker}:{args.port}, "
+          f"rate={'max' if args.rate <= 0 else args.rate}/s, topics={topics}, sizes={sizes}, qos={qos_levels}")
+    try:
+        asyncio.run(_run_load(args, topics, sizes, qos_levels))
+    except KeyboardInterrupt:
+        pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MQTT tweet publisher")
+    parser.add_argument("--broker", default=BROKER)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--load", action="store_true", help="run the headless load generator instead of the GUI")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent client connections")
+    parser.add_argument("--rate", type=float, default=0, help="total messages/s across all clients (0 = as fast as possible)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run (0 = until Ctrl-C)")
+    parser.add_argument("--hashtags", default="#loadtest", help="comma-separated hashtags")
+    parser.add_argument("--sizes", default="140", help="comma-separated message body sizes in bytes")
+    parser.add_argument("--qos", default="0", help="comma-separated QoS levels")
+    parser.add_argument("--max-pending", type=int, default=100, help="max unacked messages per client")
+    parser.add_argument("--batch", action="store_true", help="send tweets in framed batches per topic")
+    parser.add_argument("--linger-ms", type=float, default=BATCH_LINGER_MS, help="max time a tweet waits for its batch")
+    parser.add_argument("--batch-bytes", type=int, default=BATCH_MAX_BYTES, help="flush a batch at this many payload bytes")
+    parser.add_argument("--batch-count", type=int, default=BATCH_MAX_COUNT, help="flush a batch at this many tweets")
+    parser.add_argument("--compress", action="store_true", help="deflate payloads with the newest dictionary in dicts/")
+    parser.add_argument("--report-interval", type=float, default=1.0)
+    parser.add_argument("--topic-qos", default="", help="GUI: per-topic QoS, e.g. '#news=2,#chat=0'")
+    parser.add_argument("--default-qos", type=int, choices=(0, 1, 2), default=DEFAULT_QOS, help="GUI: QoS for other topics")
+    parser.add_argument("--outbox", default=OUTBOX_PATH, help="GUI: outbox log file ('' disables the outbox)")
+    parser.add_argument("--window", type=int, default=INFLIGHT_WINDOW, help="GUI: max unacked messages before publishing pauses")
+    parser.add_argument("--client-id", default=None, help="GUI: MQTT client ID (default: a stable per-user ID)")
+    parser.add_argument("--clean-session", action="store_true", help="GUI: do not keep a broker session between connections")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = PublisherApp(root)
-    root.mainloop()
+    args = parse_args()
+    if args.load:
+        run_load(args)
+    else:
+        root = tk.Tk()
+        try:
+            topic_qos = parse_topic_qos(args.topic_qos)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        app = PublisherApp(root, broker=args.broker, port=args.port, topic_qos=topic_qos,
+                           default_qos=args.default_qos, window=args.window, outbox_path=args.outbox,
+                           client_id=args.client_id, clean_session=args.clean_session)
+        root.mainloop()
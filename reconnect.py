@@ -0,0 +1,168 @@
+# reconnect.py
+# Keeps an MQTT client connected for the GUI apps.
+#
+# Reconnector runs the client's network loop on its own thread (in place of
+# loop_start) and whenever a connection cannot be made or is lost, it waits out
+# a capped exponential backoff with full jitter before trying again: the n-th
+# retry sleeps a random time in [0, min(MAX_DELAY_S, INITIAL_DELAY_S * 2**n)],
+# so a fleet of clients cut off by the same outage does not reconnect in
+# lockstep. The backoff only resets once a connection has stayed up for
+# STABLE_S, so a broker that accepts and immediately drops clients is not
+# hammered either.
+#
+# That thread is the only one that writes to the socket. Without loop_start(),
+# paho would send a publish(), subscribe() or disconnect() made on the Tk thread
+# right away, racing the loop's own writes on the same socket. A no-op
+# on_socket_register_write tells paho an event loop takes care of writing, so
+# those calls only queue the packet and wake loop() through its socketpair.
+# close() therefore disconnects through the loop too, and waits for it.
+#
+# The apps connect with clean_session=False under a client ID that is stable
+# across restarts (client_id_for), so the broker keeps their subscriptions and
+# queues QoS 1 messages for them while they are away; on_connect sees
+# flags["session present"] and skips resubscribing. A running instance holds a
+# lock on its ID (see datadir.py), so a second instance of the same app on the
+# same data directory gets an ID, and a session, of its own instead of taking
+# over the first one's.
+# Dependencies: a paho-mqtt compatible client (see transport.py)
+
+import os
+import random
+import threading
+import time
+import uuid
+
+from datadir import DATA_DIR, MAX_INSTANCES, InUseError, instance_path, lock
+
+CLIENT_ID_DIR = os.path.join(DATA_DIR, "client-ids")
+
+INITIAL_DELAY_S = 1.0
+MAX_DELAY_S = 60.0
+STABLE_S = 30.0
+LOOP_TIMEOUT_S = 1.0
+# how long close() waits for the DISCONNECT to go out
+CLOSE_TIMEOUT_S = 2.0
+
+MQTT_ERR_SUCCESS = 0
+
+# locks on the client IDs this process uses, held until it exits
+_id_locks = []
+
+
+def client_id_for(role, directory=CLIENT_ID_DIR):
+    # "<role>-<12 hex digits>", created once and reused; MQTT 3.1.1 brokers only
+    # have to accept IDs of up to 23 characters. Each running instance of a role
+    # takes the first ID not locked by another: <role>, <role>-2, ... on disk
+    name = None
+    for n in range(1, MAX_INSTANCES + 1):
+        try:
+            _id_locks.append(lock(os.path.join(directory, instance_path(role, n) + ".lock")))
+        except InUseError:
+            continue
+        except OSError:
+            break
+        name = instance_path(role, n)
+        break
+    if name is None:
+        # usable for this run, just not stable
+        return f"{role}-{uuid.uuid4().hex[:12]}"
+    path = os.path.join(directory, name)
+    try:
+        with open(path, encoding="utf-8") as f:
+            client_id = f.read().strip()
+        if client_id:
+            return client_id
+    except OSError:
+        pass
+    client_id = f"{role}-{uuid.uuid4().hex[:12]}"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(client_id + "\n")
+    except OSError:
+        # still usable for this run, just not stable
+        pass
+    return client_id
+
+
+class Backoff:
+    def __init__(self, initial=INITIAL_DELAY_S, maximum=MAX_DELAY_S, rng=random.random):
+        self.initial = initial
+        self.maximum = maximum
+        self.rng = rng
+        self.attempts = 0
+
+    def next_delay(self):
+        ceiling = min(self.maximum, self.initial * 2 ** min(self.attempts, 32))
+        self.attempts += 1
+        return ceiling * self.rng()
+
+    def reset(self):
+        self.attempts = 0
+
+
+class Reconnector:
+    def __init__(self, client, host, port, keepalive, on_retry=None, backoff=None,
+                 stable_s=STABLE_S, clock=time.monotonic):
+        # on_retry(delay_s, attempt, error) runs on the reconnect thread before each
+        # wait; error is the exception that ended the attempt, or None when the
+        # connection was lost
+        self.client = client
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.on_retry = on_retry
+        self.backoff = backoff or Backoff()
+        self.stable_s = stable_s
+        self.clock = clock
+        self._stop = threading.Event()      # leave the loop now
+        self._closing = threading.Event()   # leave once the loop returns, see close()
+        self._thread = None
+        client.on_socket_register_write = _defer_write
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mqtt-reconnect", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # the thread exits within LOOP_TIMEOUT_S, without disconnecting
+        self._closing.set()
+        self._stop.set()
+
+    def close(self, timeout=CLOSE_TIMEOUT_S):
+        # disconnects cleanly: the DISCONNECT, and anything queued before it, is sent
+        # by this thread's loop, which then returns
+        self._closing.set()
+        self.client.disconnect()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._stop.set()
+
+    def _run(self):
+        while not self._closing.is_set():
+            error = None
+            try:
+                self.client.connect(self.host, self.port, self.keepalive)
+            except Exception as e:
+                error = e
+            else:
+                started = self.clock()
+                rc = MQTT_ERR_SUCCESS
+                try:
+                    while rc == MQTT_ERR_SUCCESS and not self._stop.is_set():
+                        rc = self.client.loop(LOOP_TIMEOUT_S)
+                except Exception as e:
+                    # e.g. raised by a callback; the next connect() starts over on a new socket
+                    error = e
+                if self.clock() - started >= self.stable_s:
+                    self.backoff.reset()
+            if self._closing.is_set():
+                return
+            delay = self.backoff.next_delay()
+            if self.on_retry is not None:
+                self.on_retry(delay, self.backoff.attempts, error)
+            self._closing.wait(delay)
+
+
+def _defer_write(client, userdata, sock):
+    pass
@@ -0,0 +1,175 @@
+# rxbuffer.py
+# Bounded receive buffer between the MQTT thread and the Tk thread in
+# subscriber.py. It has the subset of the queue.Queue API the app uses (put,
+# get_nowait, qsize, empty) and never grows past its capacity.
+#
+# Items are kept in lanes. Control items (put_control, e.g. "[System] Subscribed")
+# have their own lane, which is always served first. Everything else goes into
+# one lane per key (the topic), and get_nowait() serves those lanes round-robin,
+# so a flooding hashtag gets its share of the renderer but cannot bury quieter
+# ones. Empty lanes are dropped when their turn comes. Lane lengths are tracked
+# in buckets (length -> lanes of that length), so finding the longest lane does
+# not depend on how many topics are queued.
+#
+# The capacity covers all topic lanes together. When it is reached and the
+# incoming item's lane is not the longest, the longest lane gives up its oldest
+# item. Otherwise the incoming lane is the one flooding, and the overflow policy
+# decides what it loses:
+#
+#   drop-oldest   evict the lane's oldest item to make room (newest tweets win)
+#   drop-newest   reject the incoming item (what is queued is kept)
+#   sample        admit every Nth incoming item, evicting the lane's oldest for it
+#   collapse      reject incoming items, and put a single "N tweets skipped"
+#                 marker in their place once the lane has room again
+#
+# Every item that is shed is counted exactly, including control items pushed
+# out of their lane once it holds CONTROL_CAPACITY. A collapse marker evicted
+# before it is served is not shed: its count goes back to the lane's skipped
+# total and a later marker reports it.
+# Dependencies: none (stdlib only)
+
+import queue
+import threading
+from collections import deque
+
+DEFAULT_CAPACITY = 50000
+CONTROL_CAPACITY = 1000
+POLICIES = ("drop-oldest", "drop-newest", "sample", "collapse")
+SAMPLE_N = 10
+
+
+class ReceiveBuffer:
+    def __init__(self, capacity=DEFAULT_CAPACITY, policy="drop-oldest", sample_n=SAMPLE_N,
+                 marker=None, key=None):
+        # marker(n, lane_key) builds the item standing in for n collapsed items;
+        # key(item) picks an item's lane
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r}")
+        self.capacity = capacity
+        self.policy = policy
+        self.sample_n = sample_n
+        self.marker = marker or (lambda n, lane_key: f"[{n} skipped]")
+        self.key = key or (lambda item: None)
+        self.lock = threading.Lock()
+        self.control = deque()
+        self.lanes = {}          # key -> deque of (collapsed count, item); 0 for plain items
+        self.ready = deque()     # keys of the lanes, in round-robin order
+        self.by_length = {}      # lane length -> keys of the non-empty lanes that long
+        self.longest = 0         # length of the longest lane
+        self.size = 0            # items in topic lanes
+        self.shed = 0            # items dropped, all lanes and policies together
+        self.skipped = {}        # key -> items collapsed and not yet reported by a marker
+        self._overflow = 0       # items seen while full, for sampling
+
+    def set_policy(self, policy):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r}")
+        with self.lock:
+            self.policy = policy
+            self._overflow = 0
+
+    def put_control(self, item):
+        with self.lock:
+            if len(self.control) >= CONTROL_CAPACITY:
+                self.control.popleft()
+                self.shed += 1
+            self.control.append(item)
+
+    def _resized(self, lane_key, old, new):
+        # lengths only ever move by one, so the longest lane is found without a scan
+        if old:
+            keys = self.by_length[old]
+            keys.discard(lane_key)
+            if not keys:
+                del self.by_length[old]
+                if old == self.longest:
+                    self.longest = new
+        if new:
+            self.by_length.setdefault(new, set()).add(lane_key)
+            if new > self.longest:
+                self.longest = new
+
+    def _append(self, lane_key, item, collapsed=0):
+        lane = self.lanes.get(lane_key)
+        if lane is None:
+            lane = self.lanes[lane_key] = deque()
+            self.ready.append(lane_key)
+        lane.append((collapsed, item))
+        self._resized(lane_key, len(lane) - 1, len(lane))
+        self.size += 1
+
+    def _evict(self, lane_key):
+        # an emptied lane stays in self.lanes and self.ready until get_nowait() reaches it
+        lane = self.lanes[lane_key]
+        collapsed, _ = lane.popleft()
+        self._resized(lane_key, len(lane) + 1, len(lane))
+        self.size -= 1
+        if collapsed:
+            self.skipped[lane_key] = self.skipped.get(lane_key, 0) + collapsed
+        else:
+            self.shed += 1
+
+    def put(self, item):
+        # never blocks; returns False when the item was shed
+        lane_key = self.key(item)
+        with self.lock:
+            if self.size < self.capacity:
+                skipped = self.skipped.pop(lane_key, 0)
+                if skipped:
+                    # the marker may take the buffer one item past capacity
+                    self._append(lane_key, self.marker(skipped, lane_key), skipped)
+                self._append(lane_key, item)
+                self._overflow = 0
+                return True
+            own = self.lanes.get(lane_key)
+            if own is None or len(own) < self.longest:
+                # fair share: the longest lane pays for the overflow
+                self._evict(next(iter(self.by_length[self.longest])))
+                self._append(lane_key, item)
+                return True
+            policy = self.policy
+            if policy == "drop-newest":
+                self.shed += 1
+                return False
+            if policy == "collapse":
+                self.shed += 1
+                self.skipped[lane_key] = self.skipped.get(lane_key, 0) + 1
+                return False
+            if policy == "sample":
+                self._overflow += 1
+                if self._overflow % self.sample_n:
+                    self.shed += 1
+                    return False
+                # the admitted sample replaces the lane's oldest item, which is the one shed
+            self._evict(lane_key)
+            self._append(lane_key, item)
+            return True
+
+    def get_nowait(self):
+        with self.lock:
+            if self.control:
+                return self.control.popleft()
+            while self.ready:
+                lane_key = self.ready.popleft()
+                lane = self.lanes[lane_key]
+                if not lane:
+                    del self.lanes[lane_key]
+                    continue
+                _, item = lane.popleft()
+                self._resized(lane_key, len(lane) + 1, len(lane))
+                self.size -= 1
+                if lane:
+                    self.ready.append(lane_key)
+                else:
+                    del self.lanes[lane_key]
+                return item
+            if self.skipped:
+                lane_key, n = self.skipped.popitem()
+                return self.marker(n, lane_key)
+        raise queue.Empty
+
+    def qsize(self):
+        return self.size + len(self.control) + len(self.skipped)
+
+    def empty(self):
+        return not self.qsize()
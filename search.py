@@ -0,0 +1,213 @@
+# search.py
+# In-memory full-text index over received tweets, maintained incrementally from
+# the subscriber's receive path. Document IDs are timeline store offsets (see
+# store.py), so results are read back from the store and the index only holds
+# postings.
+#
+# Tokens are lowercased words, #hashtags and @mentions; a hashtag or mention is
+# indexed both with and without its sign, so "python" also finds "#python" while
+# "#python" only finds the hashtag. A tweet's topic is indexed as its hashtag.
+#
+# Queries are whitespace-separated clauses that must all match:
+#
+#   word  #tag  @user   exact term
+#   pyth*               any term starting with "pyth"
+#   "hello world"       the words in this order (checked against the stored text)
+#
+# Results are newest first. Postings are sorted arrays, so matching walks the
+# smallest clause from the newest end and checks the other clauses by binary
+# search, stopping as soon as enough results are found. Phrases are checked
+# against the store only after the lock is released, on at most
+# MAX_PHRASE_CANDIDATES documents matching all the words. The total number of
+# postings is bounded; past the limit the oldest documents are dropped.
+# Dependencies: none (stdlib only)
+
+import bisect
+import heapq
+import re
+import threading
+from array import array
+
+MAX_POSTINGS = 5_000_000
+# compaction drops the oldest documents until this share of the limit is left
+COMPACT_TO = 0.75
+# a prefix clause expands to at most this many terms
+MAX_PREFIX_TERMS = 256
+# a phrase query reads at most this many candidate documents back from the store
+MAX_PHRASE_CANDIDATES = 1000
+
+_TOKEN_RE = re.compile(r"[#@]?\w+(?:'\w+)*")
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    # terms in order of appearance, with the #/@ sign kept
+    return _TOKEN_RE.findall(text.lower())
+
+
+def index_terms(text):
+    terms = set()
+    for token in tokenize(text):
+        terms.add(token)
+        if token[0] in "#@":
+            terms.add(token[1:])
+    return terms
+
+
+def _bare(token):
+    return token[1:] if token[0] in "#@" else token
+
+
+def _contains(postings, doc):
+    i = bisect.bisect_left(postings, doc)
+    return i < len(postings) and postings[i] == doc
+
+
+class SearchIndex:
+    # add() runs on the MQTT network thread, search() on the Tk thread
+    def __init__(self, doc_text, max_postings=MAX_POSTINGS):
+        # doc_text(doc) returns the document's text, or None once it is gone
+        self.doc_text = doc_text
+        self.max_postings = max_postings
+        self.lock = threading.Lock()
+        self.postings = {}          # term -> array of doc IDs, ascending
+        self.vocab = []             # sorted terms, for prefix queries
+        self.new_terms = []         # terms added since vocab was last sorted
+        self.docs = array("Q")      # indexed doc IDs, ascending
+        self.doc_terms = array("H") # number of postings per doc, parallel to docs
+        self.total = 0
+        self.compactions = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, doc, text, topic=None):
+        terms = index_terms(text)
+        if topic:
+            terms.add("#" + topic.rsplit("/", 1)[-1].lower())
+        with self.lock:
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = array("Q")
+                    self.new_terms.append(term)
+                # history indexed after live tweets arrives out of order
+                if not postings or postings[-1] < doc:
+                    postings.append(doc)
+                else:
+                    postings.insert(bisect.bisect_left(postings, doc), doc)
+            if not self.docs or self.docs[-1] < doc:
+                self.docs.append(doc)
+                self.doc_terms.append(min(len(terms), 0xFFFF))
+            else:
+                i = bisect.bisect_left(self.docs, doc)
+                self.docs.insert(i, doc)
+                self.doc_terms.insert(i, min(len(terms), 0xFFFF))
+            self.total += len(terms)
+            if self.total > self.max_postings:
+                self._compact()
+
+    def _compact(self):
+        target = int(self.max_postings * COMPACT_TO)
+        dropped = n = 0
+        while n < len(self.docs) and self.total - dropped > target:
+            dropped += self.doc_terms[n]
+            n += 1
+        if n == len(self.docs):
+            self.postings.clear()
+            self.vocab = []
+            self.new_terms = []
+            self.docs = array("Q")
+            self.doc_terms = array("H")
+            self.total = 0
+            return
+        cutoff = self.docs[n]
+        del self.docs[:n]
+        del self.doc_terms[:n]
+        for term in list(self.postings):
+            postings = self.postings[term]
+            i = bisect.bisect_left(postings, cutoff)
+            if i == len(postings):
+                del self.postings[term]
+            elif i:
+                del postings[:i]
+        self.vocab = sorted(self.postings)
+        self.new_terms = []
+        self.total -= dropped
+        self.compactions += 1
+
+    def _prefix_terms(self, prefix):
+        if self.new_terms:
+            # merging a short unsorted tail into a sorted list is cheap for timsort
+            self.vocab += self.new_terms
+            self.vocab.sort()
+            self.new_terms = []
+        i = bisect.bisect_left(self.vocab, prefix)
+        out = []
+        while i < len(self.vocab) and self.vocab[i].startswith(prefix) and len(out) < MAX_PREFIX_TERMS:
+            out.append(self.vocab[i])
+            i += 1
+        return out
+
+    def _clauses(self, query):
+        # -> (list of clauses, each a list of postings arrays; list of phrases as bare-word lists)
+        clauses = []
+        phrases = []
+        for phrase, word in _QUERY_RE.findall(query.lower()):
+            if phrase:
+                tokens = tokenize(phrase)
+                if len(tokens) > 1:
+                    phrases.append([_bare(t) for t in tokens])
+                terms = [[t] for t in tokens]
+            elif word.endswith("*") and len(word) > 1:
+                terms = [self._prefix_terms(word[:-1])]
+            else:
+                terms = [[t] for t in tokenize(word)]
+            for group in terms:
+                arrays = [self.postings[t] for t in group if t in self.postings]
+                if not arrays:
+                    return None, None
+                clauses.append(arrays)
+        return clauses, phrases
+
+    def search(self, query, limit=100):
+        # returns matching doc IDs, newest first
+        with self.lock:
+            clauses, phrases = self._clauses(query)
+            if not clauses:
+                return []
+            # phrases are checked below, outside the lock, so collect spare candidates
+            wanted = max(limit, MAX_PHRASE_CANDIDATES) if phrases else limit
+            clauses.sort(key=lambda arrays: sum(len(a) for a in arrays))
+            driver, rest = clauses[0], clauses[1:]
+            candidates = heapq.merge(*(reversed(a) for a in driver), reverse=True)
+            out = []
+            last = None
+            for doc in candidates:
+                if doc == last:
+                    continue
+                last = doc
+                if all(any(_contains(a, doc) for a in arrays) for arrays in rest):
+                    out.append(doc)
+                    if len(out) >= wanted:
+                        break
+        if not phrases:
+            return out
+        matched = []
+        for doc in out:
+            if self._has_phrases(doc, phrases):
+                matched.append(doc)
+                if len(matched) >= limit:
+                    break
+        return matched
+
+    def _has_phrases(self, doc, phrases):
+        text = self.doc_text(doc)
+        if text is None:
+            return False
+        words = [_bare(t) for t in tokenize(text)]
+        for phrase in phrases:
+            n = len(phrase)
+            if not any(words[i:i + n] == phrase for i in range(len(words) - n + 1)):
+                return False
+        return True
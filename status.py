@@ -0,0 +1,67 @@
+# status.py
+# Thread-safe status channel between the MQTT/worker threads and the Tk thread.
+#
+# Any thread posts (key, text) updates; only the latest update per key is kept,
+# so a burst of events costs the GUI one refresh, not one callback each. The GUI
+# thread collects what changed with take() when notify() (e.g. TkWaker.wake)
+# tells it to. Updates for the keys in history_keys are also recorded with
+# their timestamps in a bounded history, e.g. every connect and disconnect for
+# diagnosing a flapping link.
+# Dependencies: none (stdlib only)
+
+import threading
+import time
+from collections import deque, namedtuple
+
+HISTORY_SIZE = 500
+
+Status = namedtuple("Status", "key text error time_ns seq")
+
+
+class StatusChannel:
+    def __init__(self, notify=None, history_keys=("connection",), history=HISTORY_SIZE):
+        self.notify = notify
+        self.history_keys = set(history_keys)
+        self.lock = threading.Lock()
+        self.latest = {}            # key -> Status
+        self.changed = set()        # keys posted since the last take()
+        self.history = deque(maxlen=history)
+        self._seq = 0
+
+    def post(self, key, text, error=False):
+        with self.lock:
+            self._seq += 1
+            status = Status(key, text, error, time.time_ns(), self._seq)
+            self.latest[key] = status
+            self.changed.add(key)
+            if key in self.history_keys:
+                self.history.append(status)
+        if self.notify is not None:
+            self.notify()
+
+    def take(self):
+        # Status updates posted since the last call, one per key, oldest first
+        with self.lock:
+            out = sorted((self.latest[k] for k in self.changed), key=lambda s: s.seq)
+            self.changed.clear()
+        return out
+
+    def get(self, key):
+        with self.lock:
+            return self.latest.get(key)
+
+    def events(self, since_ns=0):
+        with self.lock:
+            return [s for s in self.history if s.time_ns >= since_ns]
+
+
+def format_event(status):
+    ms = status.time_ns // 1_000_000
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ms / 1000)) + f".{ms % 1000:03d}  {status.text}"
+
+
+def flap_summary(channel, window_s=300):
+    # one-line count of recent history events for the log view, split by error flag
+    events = channel.events(time.time_ns() - int(window_s * 1e9))
+    errors = sum(1 for s in events if s.error)
+    return f"{len(events) - errors} ok / {errors} error event(s) in the last {window_s // 60} min"
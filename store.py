@@ -0,0 +1,326 @@
+# store.py
+# Persistent timeline store for the subscriber: every received tweet is appended
+# to a segmented log on disk, so history survives restarts and can grow far past
+# what the timeline widget keeps in memory.
+#
+# The store is a directory of segments, each named after the global offset of its
+# first byte (<offset>.log / <offset>.idx). A tweet's global offset is its
+# permanent ID (search.py uses it as the document ID).
+#
+#   .log record  <u32 length> <u64 recv_ns> <u16 topic length> <topic> <text>
+#   .idx entry   <u64 offset> <u32 record length> <u32 crc32 of topic>
+#   .tix entry   <u32 crc32 of topic> <u64 offset> <u32 record length>
+#
+# The index lets recent() find records without scanning the log. by_topic() goes
+# through a per-topic offset table instead: for the active segment a dict of
+# topic hash -> [(offset, length)] kept in memory, and for each sealed segment a
+# .tix file written when it is sealed, sorted by topic hash then offset and
+# binary searched, so a lookup only touches that topic's records. A sealed
+# segment without a .tix (written by an older version) gets one on first use.
+# The log itself is read through mmap. Appends are buffered in memory and written
+# out by flush() (the subscriber calls it on a timer) or once the buffer is large.
+# Sealed segments beyond the retention limit are deleted, oldest first. After a
+# crash the active segment's index is rebuilt from the log and a torn record at
+# the tail is cut off.
+#
+# A store has one writer: TimelineStore takes the lock on <directory>/.lock (see
+# datadir.py) and raises InUseError while another process has the store open,
+# as two writers would each hand out the same offsets. open_store() moves on to
+# a per-instance directory instead (timeline-2, ...).
+# Dependencies: none (stdlib only)
+
+import bisect
+import glob
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from datadir import DATA_DIR, MAX_INSTANCES, InUseError, instance_path, lock
+
+DEFAULT_DIR = os.path.join(DATA_DIR, "timeline")
+
+SEGMENT_BYTES = 16 * 1024 * 1024
+RETAIN_SEGMENTS = 64
+# flush from append() once this much is buffered
+FLUSH_BYTES = 256 * 1024
+
+_REC = struct.Struct("<IQH")
+_IDX = struct.Struct("<QII")
+_TIX = struct.Struct("<IQI")
+
+
+def topic_hash(topic):
+    return zlib.crc32(topic.encode("utf-8"))
+
+
+class Segment:
+    def __init__(self, directory, base):
+        self.base = base
+        self.log_path = os.path.join(directory, f"{base:020d}.log")
+        self.idx_path = os.path.join(directory, f"{base:020d}.idx")
+        self.tix_path = os.path.join(directory, f"{base:020d}.tix")
+        self.size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        self._map = None
+        self._map_size = 0
+        self._idx = None
+
+    def view(self):
+        # mmap of the log, remapped when the segment has grown since the last call
+        if self.size == 0:
+            return b""
+        if self._map is None or self._map_size != self.size:
+            self.close()
+            with open(self.log_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._map_size = self.size
+        return self._map
+
+    def index(self):
+        # list of (offset, length, topic hash); cached, appended to by the store
+        if self._idx is None:
+            try:
+                with open(self.idx_path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = b""
+            self._idx = list(_IDX.iter_unpack(data[:len(data) - len(data) % _IDX.size]))
+        return self._idx
+
+    def write_topic_table(self):
+        entries = sorted((h, offset, length) for offset, length, h in self.index())
+        # written aside and renamed, so a crash never leaves a partial table behind
+        tmp = self.tix_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(_TIX.pack(*e) for e in entries))
+        os.replace(tmp, self.tix_path)
+
+    def topic_entries(self, h):
+        # (offset, length) of this sealed segment's records with topic hash h, newest first
+        if not os.path.exists(self.tix_path):
+            self.write_topic_table()
+            self.drop_index_cache()
+        size = os.path.getsize(self.tix_path)
+        count = size // _TIX.size
+        if count == 0:
+            return []
+        with open(self.tix_path, "rb") as f:
+            with mmap.mmap(f.fileno(), count * _TIX.size, access=mmap.ACCESS_READ) as buf:
+                # first entry whose hash is above h
+                lo, hi = 0, count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if _TIX.unpack_from(buf, mid * _TIX.size)[0] <= h:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                out = []
+                i = lo - 1
+                while i >= 0:
+                    eh, offset, length = _TIX.unpack_from(buf, i * _TIX.size)
+                    if eh != h:
+                        break
+                    out.append((offset, length))
+                    i -= 1
+        return out
+
+    def read(self, offset, length):
+        buf = self.view()
+        pos = offset - self.base
+        _, recv_ns, n = _REC.unpack_from(buf, pos)
+        start = pos + _REC.size
+        topic = buf[start:start + n].decode("utf-8", errors="replace")
+        text = buf[start + n:pos + length].decode("utf-8", errors="replace")
+        return offset, recv_ns, topic, text
+
+    def drop_index_cache(self):
+        # sealed segments do not need their index in memory once they are older history
+        self._idx = None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class TimelineStore:
+    # append() runs on the MQTT network thread, reads and flush() on the Tk thread
+    def __init__(self, directory=DEFAULT_DIR, segment_bytes=SEGMENT_BYTES, retain_segments=RETAIN_SEGMENTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retain_segments = retain_segments
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.owner = lock(os.path.join(directory, ".lock"))
+        bases = sorted(int(os.path.basename(p)[:-4]) for p in glob.glob(os.path.join(directory, "*.log")))
+        self.segments = [Segment(directory, b) for b in bases] or [Segment(directory, 0)]
+        self._recover(self.segments[-1])
+        # topic hash -> [(offset, length)] for the active segment's flushed records
+        self._topics = {}
+        for offset, length, h in self.segments[-1].index():
+            self._topics.setdefault(h, []).append((offset, length))
+        self._log_buf = bytearray()
+        self._idx_buf = []
+        self.end = self.segments[-1].base + self.segments[-1].size   # global offset of the next record
+
+    def _recover(self, seg):
+        idx = seg.index()
+        end = seg.base
+        valid = 0
+        for offset, length, _ in idx:
+            if offset + length > seg.base + seg.size:
+                break
+            end = offset + length
+            valid += 1
+        del idx[valid:]
+        # records written to the log but not to the index
+        buf = seg.view()
+        pos = end - seg.base
+        while pos + _REC.size <= seg.size:
+            length, _, n = _REC.unpack_from(buf, pos)
+            if length < _REC.size + n or pos + length > seg.size:
+                break
+            start = pos + _REC.size
+            idx.append((seg.base + pos, length, zlib.crc32(buf[start:start + n])))
+            pos += length
+        seg.close()
+        if pos != seg.size:
+            with open(seg.log_path, "r+b") as f:
+                f.truncate(pos)
+            seg.size = pos
+        with open(seg.idx_path, "wb") as f:
+            f.write(b"".join(_IDX.pack(*e) for e in idx))
+        if not os.path.exists(seg.log_path):
+            open(seg.log_path, "wb").close()
+
+    def append(self, topic, text, recv_ns):
+        # returns the tweet's global offset
+        t = topic.encode("utf-8")
+        body = text.encode("utf-8")
+        length = _REC.size + len(t) + len(body)
+        with self.lock:
+            offset = self.end
+            self._log_buf += _REC.pack(length, recv_ns, len(t))
+            self._log_buf += t
+            self._log_buf += body
+            self._idx_buf.append((offset, length, zlib.crc32(t)))
+            self.end += length
+            if len(self._log_buf) >= FLUSH_BYTES:
+                self._flush()
+        return offset
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._idx_buf:
+            return
+        seg = self.segments[-1]
+        # loaded before the append below, which it would otherwise read back as well
+        idx = seg.index()
+        with open(seg.log_path, "ab") as f:
+            f.write(self._log_buf)
+        # index after log: a crash in between leaves records that _recover() re-indexes
+        with open(seg.idx_path, "ab") as f:
+            f.write(b"".join(_IDX.pack(*e) for e in self._idx_buf))
+        idx.extend(self._idx_buf)
+        for offset, length, h in self._idx_buf:
+            self._topics.setdefault(h, []).append((offset, length))
+        seg.size += len(self._log_buf)
+        self._log_buf = bytearray()
+        self._idx_buf = []
+        if seg.size >= self.segment_bytes:
+            self._roll()
+
+    def _roll(self):
+        sealed = self.segments[-1]
+        sealed.write_topic_table()
+        sealed.drop_index_cache()
+        self._topics = {}
+        seg = Segment(self.directory, self.end)
+        open(seg.log_path, "wb").close()
+        open(seg.idx_path, "wb").close()
+        self.segments.append(seg)
+        while len(self.segments) > self.retain_segments:
+            old = self.segments.pop(0)
+            old.close()
+            for path in (old.log_path, old.idx_path, old.tix_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _segment_for(self, offset):
+        i = bisect.bisect_right([s.base for s in self.segments], offset) - 1
+        return self.segments[i] if i >= 0 else None
+
+    def read(self, offset):
+        # (offset, recv_ns, topic, text) for the record at a global offset, or None
+        # once retention has deleted it
+        with self.lock:
+            self._flush()
+            seg = self._segment_for(offset)
+            if seg is None or offset >= seg.base + seg.size:
+                return None
+            length = _REC.unpack_from(seg.view(), offset - seg.base)[0]
+            return seg.read(offset, length)
+
+    def recent(self, n):
+        # the newest n records, oldest first
+        with self.lock:
+            self._flush()
+            out = []
+            for seg in reversed(self.segments):
+                for offset, length, _ in reversed(seg.index()):
+                    out.append(seg.read(offset, length))
+                    if len(out) >= n:
+                        break
+                if seg is not self.segments[-1]:
+                    seg.drop_index_cache()
+                if len(out) >= n:
+                    break
+            out.reverse()
+            return out
+
+    def by_topic(self, topic, n):
+        # the newest n records for one topic, oldest first
+        h = topic_hash(topic)
+        with self.lock:
+            self._flush()
+            out = []
+            for seg in reversed(self.segments):
+                if seg is self.segments[-1]:
+                    entries = reversed(self._topics.get(h, ()))
+                else:
+                    entries = seg.topic_entries(h)
+                for offset, length in entries:
+                    record = seg.read(offset, length)
+                    # another topic can share the hash
+                    if record[2] != topic:
+                        continue
+                    out.append(record)
+                    if len(out) >= n:
+                        break
+                if len(out) >= n:
+                    break
+            out.reverse()
+            return out
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            for seg in self.segments:
+                seg.close()
+        self.owner.close()
+
+
+def open_store(directory=DEFAULT_DIR):
+    # the first store no other process has open: directory, then its per-instance variants
+    for n in range(1, MAX_INSTANCES + 1):
+        try:
+            return TimelineStore(instance_path(directory, n))
+        except InUseError:
+            continue
+    raise InUseError(f"all {MAX_INSTANCES} timeline stores at {directory} are in use")
@@ -1,29 +1,161 @@
 # subscriber.py
 # Run: python subscriber.py
+#      python subscriber.py --sink --hashtags "#loadtest" --output out.tsv   (headless sink)
+#      python subscriber.py --store ""                                       (GUI without the on-disk timeline store)
+#      python subscriber.py --clean-session                                  (GUI without a persistent session)
 # Dependencies: pip install paho-mqtt
 
 import tkinter as tk
-from tkinter import messagebox, scrolledtext
+from tkinter import messagebox, filedialog, scrolledtext
 import paho.mqtt.client as mqtt
+import argparse
+import os
 import threading
 import queue
 import time
+import json
+
+from datadir import DATA_DIR, InUseError
+from dedupe import Deduper, tweet_key
+from follows import FollowManager, chunk_filters
+from metrics import LatencyHistogram
+from reconnect import Reconnector, client_id_for
+from rxbuffer import POLICIES as RX_POLICIES, ReceiveBuffer
+from search import SearchIndex
+from status import StatusChannel, flap_summary, format_event
+from store import DEFAULT_DIR as STORE_DIR, open_store
+from timeline import TimelineView
+from topics import TopicTrie, valid_filter
+from trending import TrendTracker, hashtags
+from tkwake import TkWaker
+from wire import DICT_DIR, UnknownDictionaryError, WireError, decode_strict, load_dictionaries
 
 BROKER = "test.mosquitto.org"
 PORT = 1883
 KEEPALIVE = 60
 
+# GUI rendering: at most RENDER_BATCH messages and RENDER_BUDGET_MS of work per tick,
+# anything left over is carried to the next tick. Ticks are driven by wakeups from
+# the MQTT thread (tkwake.py), not by polling.
+RENDER_BATCH = 500
+RENDER_BUDGET_MS = 15
+BACKLOG_INTERVAL_MS = 1
+
+# number of messages kept in the timeline; older ones are dropped
+TIMELINE_CAPACITY = 10000
+
+# receive buffer between the MQTT thread and the GUI (see rxbuffer.py): at most
+# RX_CAPACITY tweets wait to be rendered, RX_POLICY decides what is shed beyond that
+RX_CAPACITY = 50000
+RX_POLICY = "drop-oldest"
+RX_SAMPLE_N = 10
+
+# how often the latency summary in the UI is refreshed
+STATS_INTERVAL_MS = 1000
+
+# timeline store (see store.py): received tweets are written out this long after
+# they arrive; the newest HISTORY_ON_START of them are shown again on the next start
+STORE_FLUSH_MS = 500
+HISTORY_ON_START = TIMELINE_CAPACITY
+# subscribing to a single topic first shows up to this many of its stored tweets
+BACKFILL_ON_SUBSCRIBE = 50
+
+# search (see search.py): stored tweets indexed in the background on startup, and
+# the most results shown for one query
+INDEX_ON_START = 200000
+SEARCH_LIMIT = 200
+
+# headless sink: sequence numbers counted as lost are remembered per publisher, up to
+# this many, so one arriving late is told apart from a duplicate
+SINK_MISSING_PER_PUBLISHER = 100000
+
+# followed topics are saved here and restored on the next start; they are subscribed
+# at QoS 1 so the broker queues tweets for the persistent session while we are away
+FOLLOWS_PATH = os.path.join(DATA_DIR, "follows.txt")
+SUBSCRIBE_QOS = 1
+# per client ID, the filters the broker has acknowledged for its persistent session;
+# follows.txt is what the user wants followed, this is what the session holds
+SESSION_DIR = os.path.join(DATA_DIR, "sessions")
+
+# trending mode: follow every hashtag, count them (see trending.py) and rank the top ones
+TRENDING_TOPIC = "twitter/#"
+TRENDING_COUNT = 15
+TRENDING_REFRESH_MS = 2000
+
 def normalize_topic(raw_hashtag: str) -> str:
+    # "#python" -> twitter/python; MQTT wildcards are allowed below twitter/, so
+    # "#python/+" follows every subtopic of python and "##" every hashtag
     tag = raw_hashtag.strip()
     if tag.startswith("#"):
         tag = tag[1:].strip()
     if not tag:
         return ""
-    return f"twitter/{tag}"
+    topic = f"twitter/{tag}"
+    return topic if valid_filter(topic) else ""
+
+def make_client(client_id, clean_session=True):
+    return mqtt.Client(client_id=client_id, clean_session=clean_session)
+
+def load_follows(path):
+    # one topic filter per line; invalid lines are skipped
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [t for t in (line.strip() for line in f) if t and valid_filter(t)]
+    except OSError:
+        return []
+
+def parse_follow_list(lines):
+    # one hashtag or topic per line ("#python", "python/+", "twitter/python"), blank
+    # lines skipped; returns (topics, number of invalid lines)
+    topics = []
+    invalid = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        topic = line if line.startswith("twitter/") and valid_filter(line) else normalize_topic(line)
+        if topic:
+            topics.append(topic)
+        else:
+            invalid += 1
+    return topics, invalid
+
+def save_follows(path, topics):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(t + "\n" for t in sorted(topics))
+    os.replace(tmp, path)
+
+def history_line(recv_ns, topic, text):
+    # a stored tweet as a timeline line
+    ts = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(recv_ns / 1e9))
+    text = " ".join(text.splitlines())
+    return f"[{ts}] {topic} — {text}"
+
+def decode_message(msg):
+    # shared receive path for the GUI and the headless sink: (topic, [Tweet, ...], recv_ns);
+    # batched messages unpack into several tweets, see wire.py for the accepted formats;
+    # raises WireError for a payload that cannot be decoded
+    recv_ns = time.time_ns()
+    return msg.topic, decode_strict(msg.payload), recv_ns
+
+def undecodable_note(error, unknown_dicts):
+    # a message to show once per missing compression dictionary, else None
+    if not isinstance(error, UnknownDictionaryError) or error.dict_id in unknown_dicts:
+        return None
+    unknown_dicts.add(error.dict_id)
+    return (f"Dropping tweets compressed with dictionary {error.dict_id:#x}, which is not in "
+            f"{os.path.basename(DICT_DIR)}/; copy it from the publisher (see dicttool.py)")
 
 class SubscriberApp:
-    def __init__(self, root):
+    def __init__(self, root, broker=BROKER, port=PORT, client_factory=make_client, store_dir=STORE_DIR,
+                 rx_capacity=RX_CAPACITY, rx_policy=RX_POLICY, rx_sample_n=RX_SAMPLE_N,
+                 follows_path=FOLLOWS_PATH, client_id=None, clean_session=False, session_dir=SESSION_DIR):
+        # client_factory(client_id, clean_session) returns a paho-compatible client, see transport.py
         self.root = root
+        self.broker = broker
+        self.port = port
         root.title("MQTT Hashtag Follower (Subscriber)")
 
         frame = tk.Frame(root, padx=10, pady=10)
@@ -41,96 +173,431 @@ class SubscriberApp:
         self.unsubscribe_btn.grid(row=0, column=3, padx=6)
 
         tk.Label(frame, text="Received tweets:").grid(row=1, column=0, columnspan=4, sticky="w", pady=(10,0))
-        self.messages_box = scrolledtext.ScrolledText(frame, width=80, height=20, state=tk.DISABLED, wrap=tk.WORD)
+        self.messages_box = TimelineView(frame, capacity=TIMELINE_CAPACITY, width=80, height=20)
         self.messages_box.grid(row=2, column=0, columnspan=4, padx=6, pady=6)
 
         self.status_label = tk.Label(frame, text="Disconnected", fg="red")
-        self.status_label.grid(row=3, column=0, columnspan=4, sticky="w")
+        self.status_label.grid(row=3, column=0, columnspan=3, sticky="w")
+
+        self.queue_label = tk.Label(frame, text="Queued: 0", fg="gray")
+        self.queue_label.grid(row=3, column=3, sticky="e")
+
+        self.latency_label = tk.Label(frame, text="Latency: -", fg="gray", anchor="w")
+        self.latency_label.grid(row=4, column=0, columnspan=3, sticky="w")
+
+        self.export_btn = tk.Button(frame, text="Export latency", command=self.export_latency, width=12)
+        self.export_btn.grid(row=4, column=3, padx=6)
+        tk.Button(frame, text="Connection log", command=self.show_connection_log).grid(row=4, column=4, sticky="w")
+
+        # status updates come from the MQTT thread too; the Tk thread applies the latest per key
+        self.status = StatusChannel()
+        self.status_waker = TkWaker(root, self.apply_status)
+        self.status.notify = self.status_waker.wake
+
+        self.import_btn = tk.Button(frame, text="Import follows...", command=self.import_follows, width=12)
+        self.import_btn.grid(row=5, column=3, padx=6)
+
+        tk.Label(frame, text="Search:").grid(row=5, column=0, sticky="w")
+        self.search_entry = tk.Entry(frame, width=40)
+        self.search_entry.grid(row=5, column=1, padx=6, pady=4)
+        self.search_entry.bind("<Return>", lambda e: self.search())
+        self.search_btn = tk.Button(frame, text="Search", command=self.search, width=12)
+        self.search_btn.grid(row=5, column=2, padx=6)
+        self.results_window = None
+
+        # trending mode subscribes to every hashtag; tweets only reach the timeline
+        # when they match one of the user's own subscriptions
+        self.trending_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame, text="Trending", variable=self.trending_var,
+                       command=self.toggle_trending).grid(row=0, column=4, sticky="w")
+        tk.Label(frame, text="Trending now:").grid(row=1, column=4, sticky="w", pady=(10,0))
+        self.trending_box = tk.Listbox(frame, width=30, height=20)
+        self.trending_box.grid(row=2, column=4, padx=6, pady=6, sticky="n")
+        self.trending_box.bind("<Double-Button-1>", self.pick_trending)
+        self.trends = TrendTracker()
+        # repeated deliveries of one tweet (overlapping subscriptions, QoS 1 redelivery)
+        self.dedupe = Deduper()
+        # payloads that could not be decoded, and the missing dictionaries already reported
+        self.undecodable = 0
+        self.unknown_dicts = set()
+        # mirrors trending_var for the MQTT thread, which must not touch Tk variables
+        self.trending = False
+        self._trending_scheduled = False
 
         # set of subscribed topics
         self.subscribed = set()
+        # the same filters as a trie, for routing incoming topics (read on the MQTT thread)
+        self.routes = TopicTrie()
+        self.routes_lock = threading.Lock()
+        # None disables saving the follow list
+        self.follows_path = follows_path
+        if follows_path:
+            for t in load_follows(follows_path):
+                self.subscribed.add(t)
+                self.routes.insert(t)
+
+        # bounded queue for incoming messages from MQTT thread to GUI, with system
+        # notices served first and one round-robin lane per topic; shed tweets are
+        # still stored and indexed, they only miss the live timeline
+        self.msg_queue = ReceiveBuffer(rx_capacity, rx_policy, rx_sample_n, key=lambda item: item[0],
+                                       marker=lambda n, topic: (topic, f"[System] {n} tweets skipped", time.time_ns()))
+        rx_row = tk.Frame(frame)
+        rx_row.grid(row=3, column=4, sticky="w")
+        tk.Label(rx_row, text="On overflow:").pack(side=tk.LEFT)
+        self.rx_policy_var = tk.StringVar(value=rx_policy)
+        tk.OptionMenu(rx_row, self.rx_policy_var, *RX_POLICIES, command=self.msg_queue.set_policy).pack(side=tk.LEFT)
 
-        # queue for incoming messages from MQTT thread to GUI
-        self.msg_queue = queue.Queue()
+        # rolling latency histograms: broker transit (send -> on_message),
+        # queue wait (on_message -> process_queue) and render (dequeue -> on screen)
+        self.latency = {
+            "transit": LatencyHistogram("transit"),
+            "queue": LatencyHistogram("queue"),
+            "render": LatencyHistogram("render"),
+        }
+        self._stats_scheduled = False
+        self._drain_scheduled = False
+
+        # received tweets are kept on disk; None disables the store. Another subscriber
+        # may have it open, then this one gets a store of its own
+        self.store = None
+        if store_dir:
+            try:
+                self.store = open_store(store_dir)
+            except InUseError as e:
+                self.update_status(f"Timeline store disabled: {e}", error=True)
+            else:
+                if self.store.directory != store_dir:
+                    self.update_status(f"Timeline store in use by another subscriber; using {self.store.directory}",
+                                       error=False)
+        self._flush_scheduled = False
+        self.load_history()
+
+        # the index needs the store to read results back; history is indexed on a
+        # background thread, live tweets from on_message
+        self.index = None
+        if self.store is not None:
+            self.index = SearchIndex(self.stored_text)
+            threading.Thread(target=self.index_history, args=(self.store.end,), daemon=True).start()
+        else:
+            self.search_btn.config(state=tk.DISABLED)
+
+        # compression dictionaries for compressed payloads (see dicttool.py)
+        load_dictionaries()
 
         # MQTT client
-        self.client = mqtt.Client(client_id=f"subscriber-{int(time.time())}")
+        # the MQTT client ID stays the same across restarts so the broker can keep the session
+        client_id = client_id or client_id_for("subscriber")
+        self.client = client_factory(client_id, clean_session)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
+        # subscriptions go out in batches (see follows.py); a session kept from the last
+        # run holds what the broker acknowledged then, a clean one holds nothing
+        self.session_path = None
+        if session_dir and not clean_session:
+            self.session_path = os.path.join(session_dir, client_id.replace(os.sep, "_"))
+        held = load_follows(self.session_path) if self.session_path else ()
+        self.follows = FollowManager(self.client, SUBSCRIBE_QOS, held=held, on_progress=self.on_follow_progress,
+                                     on_acked=self.save_session if self.session_path else None)
+        self.client.on_subscribe = self.follows.on_subscribe
+        self.client.on_unsubscribe = self.follows.on_unsubscribe
+
+        # the MQTT thread wakes the GUI when it queues messages; bursts coalesce into one wakeup
+        self.waker = TkWaker(root, self.process_queue)
 
         self.connect_in_thread()
 
-        # schedule periodic GUI updates from queue
-        self.root.after(200, self.process_queue)
         root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def connect_in_thread(self):
-        def _connect():
-            try:
-                self.client.connect(BROKER, PORT, KEEPALIVE)
-                self.client.loop_start()
-            except Exception as e:
-                self.update_status(f"Connect error: {e}", error=True)
-        threading.Thread(target=_connect, daemon=True).start()
+        # connects, and reconnects with jittered backoff, on a thread of its own
+        self.reconnector = Reconnector(self.client, self.broker, self.port, KEEPALIVE, on_retry=self.on_retry)
+        self.reconnector.start()
+
+    def on_retry(self, delay, attempt, error):
+        reason = f"Connect error: {error}" if error else "Connection lost"
+        self.update_status(f"{reason}; retry {attempt} in {delay:.1f}s", error=True, key="connection")
 
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
-            self.update_status(f"Connected to {BROKER}:{PORT}", error=False)
-            # re-subscribe to existing topics after reconnect
-            for t in list(self.subscribed):
-                try:
-                    self.client.subscribe(t)
-                    self.update_status(f"Subscribed to {t}", error=False)
-                except Exception:
-                    pass
+            present = flags.get("session present")
+            resumed = " (session resumed)" if present else ""
+            self.update_status(f"Connected to {self.broker}:{self.port}{resumed}", error=False, key="connection")
+            self.follows.reconnected(present)
+            self.sync_subscriptions()
         else:
-            self.update_status(f"Connect failed (rc={rc})", error=True)
+            self.update_status(f"Connect failed (rc={rc})", error=True, key="connection")
 
     def on_disconnect(self, client, userdata, rc):
-        self.update_status("Disconnected", error=True)
+        self.update_status("Disconnected", error=True, key="connection")
+
+    def desired_topics(self):
+        topics = set(self.subscribed)
+        if self.trending:
+            topics.add(TRENDING_TOPIC)
+        return topics
+
+    def sync_subscriptions(self):
+        # brings the broker session in line with what the app follows: everything after
+        # a fresh session, only changes made while offline after a resumed one; while
+        # offline nothing is sent and the next connect catches up
+        return self.follows.sync(self.desired_topics())
+
+    def on_follow_progress(self, done, total, refused):
+        text = f"Subscriptions: {done}/{total} acknowledged"
+        if refused:
+            more = "..." if len(refused) > 3 else ""
+            text += f", {len(refused)} refused ({', '.join(refused[:3])}{more})"
+        self.update_status(text, error=bool(refused))
+
+    def set_follows(self, topics):
+        # makes topics the follow list: routing, the saved list and the broker session
+        topics = set(topics)
+        with self.routes_lock:
+            for t in self.subscribed - topics:
+                self.routes.remove(t)
+            for t in topics - self.subscribed:
+                self.routes.insert(t)
+        self.subscribed = topics
+        self.save_follows()
+        return self.sync_subscriptions()
 
     def on_message(self, client, userdata, msg):
         try:
-            payload = msg.payload.decode("utf-8", errors="ignore")
-            topic = msg.topic
-            # push into queue for GUI thread
-            self.msg_queue.put((topic, payload))
+            try:
+                topic, tweets, recv_ns = decode_message(msg)
+            except WireError as e:
+                self.undecodable += 1
+                note = undecodable_note(e, self.unknown_dicts)
+                if note:
+                    self.update_status(note, error=True)
+                self.waker.wake()
+                return
+            fresh = [t for t in tweets if not self.dedupe.seen(tweet_key(t))]
+            if len(fresh) != len(tweets):
+                # let the GUI show the new suppressed count
+                self.waker.wake()
+            tweets = fresh
+            if self.trending:
+                for tweet in tweets:
+                    self.trends.add(hashtags(topic, tweet.text))
+            # drop topics no subscription asked for: the trending subscription delivers
+            # all of them, and messages can still arrive just after an unsubscribe
+            with self.routes_lock:
+                routed = self.routes.match(topic)
+            if not routed:
+                return
+            for tweet in tweets:
+                if tweet.sent_ns is not None:
+                    self.latency["transit"].add(recv_ns - tweet.sent_ns)
+                text = tweet.display()
+                if self.store is not None:
+                    offset = self.store.append(topic, text, recv_ns)
+                    self.index.add(offset, text, topic)
+                # push into queue for GUI thread
+                self.msg_queue.put((topic, text, recv_ns))
+            self.waker.wake()
         except Exception:
             pass
 
     def process_queue(self):
-        while not self.msg_queue.empty():
-            topic, payload = self.msg_queue.get()
+        self._drain_scheduled = False
+        # pull a bounded batch within the time budget and render it with a single insert
+        deadline = time.perf_counter() + RENDER_BUDGET_MS / 1000.0
+        lines = []
+        dequeued = []
+        while len(lines) < RENDER_BATCH:
+            try:
+                topic, payload, recv_ns = self.msg_queue.get_nowait()
+            except queue.Empty:
+                break
+            now_ns = time.time_ns()
+            self.latency["queue"].add(now_ns - recv_ns)
+            dequeued.append(now_ns)
             ts = time.strftime("%Y-%m-%d %H:%M:%S")
-            display = f"[{ts}] {topic} — {payload}\n"
-            self.messages_box.config(state=tk.NORMAL)
-            self.messages_box.insert(tk.END, display)
-            self.messages_box.see(tk.END)
-            self.messages_box.config(state=tk.DISABLED)
-        self.root.after(200, self.process_queue)
-
-    def update_status(self, text, error=False):
-        def _update():
-            self.status_label.config(text=text, fg="red" if error else "green")
-        self.root.after(0, _update)
+            # one row per message in the timeline
+            payload = " ".join(payload.splitlines())
+            lines.append(f"[{ts}] {topic} — {payload}")
+            if time.perf_counter() >= deadline:
+                break
+
+        if lines:
+            # the timeline only follows new messages if the user is already at the bottom
+            self.messages_box.append_many(lines)
+            done_ns = time.time_ns()
+            for dq_ns in dequeued:
+                self.latency["render"].add(done_ns - dq_ns)
+
+            if not self._stats_scheduled:
+                self._stats_scheduled = True
+                self.root.after(STATS_INTERVAL_MS, self.refresh_stats)
+            if self.store is not None and not self._flush_scheduled:
+                self._flush_scheduled = True
+                self.root.after(STORE_FLUSH_MS, self.flush_store)
+
+        backlog = self.msg_queue.qsize()
+        text = f"Queued: {backlog}"
+        if self.msg_queue.shed:
+            text += f" · shed: {self.msg_queue.shed}"
+        if self.dedupe.suppressed:
+            text += f" · duplicates dropped: {self.dedupe.suppressed}"
+        if self.undecodable:
+            text += f" · undecodable: {self.undecodable}"
+        self.queue_label.config(text=text, fg="orange" if backlog else "gray")
+        # keep draining a backlog on short ticks; once empty, wait for the next wakeup
+        if backlog and not self._drain_scheduled:
+            self._drain_scheduled = True
+            self.root.after(BACKLOG_INTERVAL_MS, self.process_queue)
+
+    def load_history(self):
+        if self.store is None:
+            return
+        lines = []
+        for _, recv_ns, topic, text in self.store.recent(HISTORY_ON_START):
+            lines.append(history_line(recv_ns, topic, text))
+        if lines:
+            self.messages_box.append_many(lines)
+            self.update_status(f"Loaded {len(lines)} tweet(s) from history", error=False)
+
+    def backfill(self, topic):
+        # tweets already stored for a topic, e.g. seen while trending or followed before;
+        # only exact topics have a per-topic index to look them up in (see store.py)
+        if self.store is None or "+" in topic or "#" in topic:
+            return
+        lines = [history_line(recv_ns, t, text)
+                 for _, recv_ns, t, text in self.store.by_topic(topic, BACKFILL_ON_SUBSCRIBE)]
+        if lines:
+            self.messages_box.append_many(lines)
+            self.update_status(f"Subscribed to {topic}; {len(lines)} earlier tweet(s) from history", error=False)
+
+    def toggle_trending(self):
+        self.trending = self.trending_var.get()
+        try:
+            # a twitter/# the user follows too stays subscribed, see desired_topics
+            self.sync_subscriptions()
+            self.update_status("Trending: following all hashtags" if self.trending else "Trending off", error=False)
+            if self.trending and not self._trending_scheduled:
+                self.refresh_trending()
+        except Exception as e:
+            self.update_status(f"Trending error: {e}", error=True)
+
+    def refresh_trending(self):
+        self._trending_scheduled = False
+        if not self.trending:
+            return
+        self.trending_box.delete(0, tk.END)
+        for rank, (tag, count) in enumerate(self.trends.top(TRENDING_COUNT), 1):
+            self.trending_box.insert(tk.END, f"{rank:2}. #{tag}  ({count})")
+        self._trending_scheduled = True
+        self.root.after(TRENDING_REFRESH_MS, self.refresh_trending)
+
+    def pick_trending(self, event):
+        # double-click copies the hashtag into the entry, ready to subscribe
+        selection = self.trending_box.curselection()
+        if not selection:
+            return
+        tag = self.trending_box.get(selection[0]).split("#", 1)[1].split()[0]
+        self.hashtag_entry.delete(0, tk.END)
+        self.hashtag_entry.insert(0, f"#{tag}")
+
+    def index_history(self, upto):
+        # tweets from upto on arrived live and are indexed by on_message
+        for offset, _, topic, text in self.store.recent(INDEX_ON_START):
+            if offset < upto:
+                self.index.add(offset, text, topic)
+
+    def stored_text(self, offset):
+        record = self.store.read(offset)
+        return record[3] if record else None
+
+    def search(self):
+        query = self.search_entry.get().strip()
+        if not query or self.index is None:
+            return
+        started = time.perf_counter()
+        docs = self.index.search(query, SEARCH_LIMIT)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        lines = []
+        for doc in docs:
+            record = self.store.read(doc)
+            if record is None:
+                continue
+            _, recv_ns, topic, text = record
+            lines.append(history_line(recv_ns, topic, text))
+        self.show_results(query, lines, elapsed_ms)
+
+    def show_results(self, query, lines, elapsed_ms):
+        if self.results_window is None or not self.results_window.winfo_exists():
+            self.results_window = tk.Toplevel(self.root)
+            self.results_text = scrolledtext.ScrolledText(self.results_window, width=100, height=25, wrap=tk.NONE)
+            self.results_text.pack(fill=tk.BOTH, expand=True)
+        self.results_window.title(f"Search: {query} — {len(lines)} result(s) in {elapsed_ms:.2f} ms "
+                                  f"({len(self.index)} tweets indexed)")
+        self.results_text.config(state=tk.NORMAL)
+        self.results_text.delete("1.0", tk.END)
+        self.results_text.insert(tk.END, "\n".join(lines) if lines else "No matches.")
+        self.results_text.config(state=tk.DISABLED)
+        self.results_window.lift()
+
+    def flush_store(self):
+        self._flush_scheduled = False
+        self.store.flush()
+
+    def refresh_stats(self):
+        self._stats_scheduled = False
+        self.latency_label.config(text="  |  ".join(h.summary() for h in self.latency.values()))
+
+    def export_latency(self):
+        path = filedialog.asksaveasfilename(
+            title="Export latency histograms",
+            defaultextension=".json",
+            filetypes=[("JSON", "*.json"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({name: h.snapshot() for name, h in self.latency.items()}, f, indent=2)
+            self.update_status(f"Latency exported to {path}", error=False)
+        except OSError as e:
+            messagebox.showerror("Export error", f"Failed to export latency: {e}")
+
+    def update_status(self, text, error=False, key="activity"):
+        # safe from any thread
+        self.status.post(key, text, error)
+
+    def apply_status(self):
+        changed = self.status.take()
+        if changed:
+            latest = changed[-1]
+            self.status_label.config(text=latest.text, fg="red" if latest.error else "green")
+
+    def show_connection_log(self):
+        win = tk.Toplevel(self.root)
+        win.title(f"Connection log ({flap_summary(self.status)})")
+        log = scrolledtext.ScrolledText(win, width=80, height=20)
+        log.pack(fill=tk.BOTH, expand=True)
+        log.insert(tk.END, "\n".join(format_event(s) for s in self.status.events()) or "No connection events yet")
+        log.config(state=tk.DISABLED)
 
     def subscribe(self):
         raw = self.hashtag_entry.get().strip()
         topic = normalize_topic(raw)
         if not topic:
-            messagebox.showwarning("Empty hashtag", "Please enter a hashtag/topic to subscribe to (e.g. #python).")
+            messagebox.showwarning("Invalid hashtag", "Please enter a hashtag/topic to subscribe to "
+                                   "(e.g. #python, #python/+ or ## for everything).")
             return
         if topic in self.subscribed:
             messagebox.showinfo("Already subscribed", f"Already subscribed to {topic}.")
             return
 
         try:
-            self.client.subscribe(topic)
-            self.subscribed.add(topic)
+            self.set_follows(self.subscribed | {topic})
             self.update_status(f"Subscribed to {topic}", error=False)
+            self.backfill(topic)
             # show a short note in messages box
-            self.msg_queue.put((topic, "[System] Subscribed"))
+            self.msg_queue.put_control((topic, "[System] Subscribed", time.time_ns()))
+            self.waker.wake()
         except Exception as e:
             messagebox.showerror("Subscribe error", f"Failed to subscribe: {e}")
             self.update_status(f"Subscribe error: {e}", error=True)
@@ -139,30 +606,232 @@ class SubscriberApp:
         raw = self.hashtag_entry.get().strip()
         topic = normalize_topic(raw)
         if not topic:
-            messagebox.showwarning("Empty hashtag", "Please enter a hashtag/topic to unsubscribe from (e.g. #python).")
+            messagebox.showwarning("Invalid hashtag", "Please enter a hashtag/topic to unsubscribe from (e.g. #python).")
             return
         if topic not in self.subscribed:
             messagebox.showinfo("Not subscribed", f"You're not subscribed to {topic}.")
             return
 
         try:
-            self.client.unsubscribe(topic)
-            self.subscribed.remove(topic)
+            self.set_follows(self.subscribed - {topic})
             self.update_status(f"Unsubscribed from {topic}", error=False)
-            self.msg_queue.put((topic, "[System] Unsubscribed"))
+            self.msg_queue.put_control((topic, "[System] Unsubscribed", time.time_ns()))
+            self.waker.wake()
         except Exception as e:
             messagebox.showerror("Unsubscribe error", f"Failed to unsubscribe: {e}")
             self.update_status(f"Unsubscribe error: {e}", error=True)
 
+    def import_follows(self):
+        path = filedialog.askopenfilename(
+            title="Import follow list",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                topics, invalid = parse_follow_list(f)
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("Import error", f"Failed to read follow list: {e}")
+            return
+        if not topics:
+            messagebox.showwarning("Import follow list", f"No valid hashtags or topics found in {path}.")
+            return
+        replace = messagebox.askyesnocancel(
+            "Import follow list",
+            f"{len(set(topics))} topic(s) read from {path}.\n\n"
+            f"Replace the current follow list ({len(self.subscribed)} topic(s))? "
+            "Yes replaces it, No adds the imported topics to it.",
+        )
+        if replace is None:
+            return
+        desired = set(topics) if replace else self.subscribed | set(topics)
+        added = len(desired - self.subscribed)
+        removed = len(self.subscribed - desired)
+        try:
+            sent, _ = self.set_follows(desired)
+        except Exception as e:
+            messagebox.showerror("Import error", f"Failed to update subscriptions: {e}")
+            self.update_status(f"Import error: {e}", error=True)
+            return
+        text = f"Follow list imported: +{added} -{removed}"
+        if invalid:
+            text += f", {invalid} invalid line(s) skipped"
+        if added and not sent:
+            text += "; subscribing once connected"
+        self.update_status(text, error=False)
+        self.msg_queue.put_control((os.path.basename(path), f"[System] Imported follow list: +{added} -{removed} topic(s)", time.time_ns()))
+        self.waker.wake()
+
+    def save_follows(self):
+        if self.follows_path:
+            try:
+                save_follows(self.follows_path, self.subscribed)
+            except OSError as e:
+                self.update_status(f"Could not save follow list: {e}", error=True)
+
+    def save_session(self, topics):
+        # MQTT thread (or whichever thread sent a packet its ack beat), under the follows lock
+        try:
+            save_follows(self.session_path, topics)
+        except OSError as e:
+            self.update_status(f"Could not save session topics: {e}", error=True)
+
     def on_close(self):
         try:
-            self.client.loop_stop()
-            self.client.disconnect()
+            self.reconnector.close()
         except Exception:
             pass
+        self.waker.close()
+        self.status_waker.close()
+        if self.store is not None:
+            self.store.close()
         self.root.destroy()
 
+class SinkConsumer:
+    # headless consumer: counts, timestamps and optionally logs every message, no Tk involved
+    def __init__(self, args, client_factory=make_client):
+        self.args = args
+        self.topics = [t for t in (normalize_topic(h) for h in args.hashtags.split(",")) if t]
+        self.out = open(args.output, "w", encoding="utf-8", buffering=1 << 20) if args.output else None
+        self.lock = threading.Lock()
+        self.count = self.nbytes = self.lost = self.late = self.dup = self.undecodable = 0
+        self.total_count = self.total_lost = self.total_late = self.total_dup = self.total_undecodable = 0
+        self.unknown_dicts = set()
+        self.latency = LatencyHistogram("transit")
+        self.total_latency = LatencyHistogram("transit", window=65536)
+        # publisher ID -> next expected sequence number
+        self.expected = {}
+        # publisher ID -> {seq: None} of seqs counted as lost, oldest first
+        self.missing = {}
+        load_dictionaries()
+
+        self.client = client_factory(f"sink-{int(time.time())}")
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"connect failed (rc={rc})")
+            return
+        for chunk in chunk_filters(self.topics):
+            client.subscribe([(t, self.args.qos) for t in chunk])
+        print(f"sink: subscribed to {self.topics} on {self.args.broker}:{self.args.port}")
+
+    def on_message(self, client, userdata, msg):
+        try:
+            topic, tweets, recv_ns = decode_message(msg)
+        except WireError as e:
+            with self.lock:
+                self.undecodable += 1
+            note = undecodable_note(e, self.unknown_dicts)
+            if note:
+                print(f"sink: {note}")
+            return
+        lost = late = dup = 0
+        for tweet in tweets:
+            if tweet.sent_ns is not None:
+                self.latency.add(recv_ns - tweet.sent_ns)
+                self.total_latency.add(recv_ns - tweet.sent_ns)
+            seq = tweet.seq
+            if seq is not None:
+                pid = tweet.publisher_id
+                expected = self.expected.get(pid, seq)
+                missing = self.missing.setdefault(pid, {})
+                if seq >= expected:
+                    if seq > expected:
+                        lost += seq - expected
+                        for gap in range(max(expected, seq - SINK_MISSING_PER_PUBLISHER), seq):
+                            missing[gap] = None
+                        while len(missing) > SINK_MISSING_PER_PUBLISHER:
+                            del missing[next(iter(missing))]
+                    self.expected[pid] = seq + 1
+                elif seq in missing:
+                    # a reordered message we already counted as lost
+                    del missing[seq]
+                    late += 1
+                else:
+                    # redelivered, or seen through a second matching subscription
+                    dup += 1
+            if self.out:
+                line = tweet.display().replace("\n", " ")
+                self.out.write(f"{recv_ns}\t{topic}\t{line}\n")
+        with self.lock:
+            self.count += len(tweets)
+            self.nbytes += len(msg.payload)
+            # late arrivals only come off the running total: the gap they fill may have
+            # been counted in an earlier interval
+            self.lost += lost
+            self.late += late
+            self.dup += dup
+
+    def take_interval(self):
+        with self.lock:
+            counts = (self.count, self.nbytes, self.lost, self.late, self.dup, self.undecodable)
+            self.total_count += self.count
+            self.total_lost += self.lost - self.late
+            self.total_late += self.late
+            self.total_dup += self.dup
+            self.total_undecodable += self.undecodable
+            self.count = self.nbytes = self.lost = self.late = self.dup = self.undecodable = 0
+            hist, self.latency = self.latency, LatencyHistogram("transit")
+        return counts, hist
+
+    def run(self):
+        if not self.topics:
+            raise SystemExit("no valid hashtags given")
+        self.client.connect(self.args.broker, self.args.port, KEEPALIVE)
+        self.client.loop_start()
+        started = time.monotonic()
+        try:
+            while self.args.duration <= 0 or time.monotonic() - started < self.args.duration:
+                time.sleep(self.args.report_interval)
+                (count, nbytes, lost, late, dup, undecodable), hist = self.take_interval()
+                per_s = 1.0 / self.args.report_interval
+                print(f"[{time.monotonic() - started:6.1f}s] recv {count * per_s:9.1f}/s  "
+                      f"{nbytes * per_s / 1024:8.1f} KiB/s  lost {lost}  late {late}  dup {dup}  "
+                      f"undecodable {undecodable}  {hist.summary()}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.client.loop_stop()
+            self.client.disconnect()
+            if self.out:
+                self.out.close()
+        self.take_interval()
+        elapsed = time.monotonic() - started
+        print(f"total: received {self.total_count} ({self.total_count / elapsed:.1f}/s), "
+              f"lost {self.total_lost}, late {self.total_late}, dup {self.total_dup}, "
+              f"undecodable {self.total_undecodable}, {self.total_latency.summary()}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MQTT hashtag follower")
+    parser.add_argument("--broker", default=BROKER)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--sink", action="store_true", help="run the headless sink instead of the GUI")
+    parser.add_argument("--hashtags", default="#loadtest", help="comma-separated hashtags to consume")
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    parser.add_argument("--output", help="append received messages to this file (tab-separated)")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run (0 = until Ctrl-C)")
+    parser.add_argument("--report-interval", type=float, default=1.0)
+    parser.add_argument("--rx-capacity", type=int, default=RX_CAPACITY, help="GUI: max tweets waiting to be rendered")
+    parser.add_argument("--rx-policy", choices=RX_POLICIES, default=RX_POLICY, help="GUI: what to shed when the receive buffer is full")
+    parser.add_argument("--sample-n", type=int, default=RX_SAMPLE_N, help="GUI: keep 1 in N tweets under the sample policy")
+    parser.add_argument("--store", default=STORE_DIR, help="GUI: timeline store directory ('' disables it)")
+    parser.add_argument("--follows", default=FOLLOWS_PATH, help="GUI: file the follow list is kept in ('' disables it)")
+    parser.add_argument("--client-id", default=None, help="GUI: MQTT client ID (default: a stable per-user ID)")
+    parser.add_argument("--clean-session", action="store_true", help="GUI: do not keep a broker session between connections")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = SubscriberApp(root)
-    root.mainloop()
+    args = parse_args()
+    if args.sink:
+        SinkConsumer(args).run()
+    else:
+        root = tk.Tk()
+        app = SubscriberApp(root, broker=args.broker, port=args.port, store_dir=args.store,
+                            rx_capacity=args.rx_capacity, rx_policy=args.rx_policy, rx_sample_n=args.sample_n,
+                            follows_path=args.follows, client_id=args.client_id, clean_session=args.clean_session)
+        root.mainloop()
@@ -0,0 +1,270 @@
+# timeline.py
+# Bounded, virtualized timeline widget used by subscriber.py
+# Dependencies: tkinter (stdlib)
+
+import tkinter as tk
+import tkinter.font as tkfont
+
+DEFAULT_CAPACITY = 10000
+
+
+class MessageRing:
+    # fixed-capacity ring buffer; appending past capacity overwrites the oldest record
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._start = 0
+        self._count = 0
+        # total number of records overwritten since creation
+        self.dropped = 0
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("ring index out of range")
+        return self._items[(self._start + i) % self.capacity]
+
+    def __iter__(self):
+        return iter(self.slice(0, self._count))
+
+    def append(self, item):
+        # returns the number of records evicted (0 or 1)
+        if self._count < self.capacity:
+            self._items[(self._start + self._count) % self.capacity] = item
+            self._count += 1
+            return 0
+        self._items[self._start] = item
+        self._start = (self._start + 1) % self.capacity
+        self.dropped += 1
+        return 1
+
+    def slice(self, first, n):
+        first = max(0, first)
+        last = min(self._count, first + n)
+        if last <= first:
+            return []
+        lo = (self._start + first) % self.capacity
+        hi = lo + (last - first)
+        if hi <= self.capacity:
+            return self._items[lo:hi]
+        return self._items[lo:] + self._items[:hi - self.capacity]
+
+    def clear(self):
+        self._items = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+
+
+class TimelineView(tk.Frame):
+    # Only the rows that fit in the window are ever inserted into the Text widget;
+    # the scrollbar is driven from the ring instead of from the Text contents, so
+    # memory and insert cost stay flat however long the timeline runs.
+    #
+    # Records are addressed by their absolute number (ring index + records dropped),
+    # which does not change as older records fall off. A render only inserts and
+    # deletes the rows entering and leaving the window, so rows that stay on screen
+    # keep their selection. The selection itself is also kept in absolute numbers:
+    # it survives scrolling, can be extended past the window with Shift-click, and
+    # <<Copy>> copies all of it from the ring, not just the part on screen.
+
+    def __init__(self, master, capacity=DEFAULT_CAPACITY, width=80, height=20, **kwargs):
+        super().__init__(master, **kwargs)
+        self.records = MessageRing(capacity)
+        self.rows = height
+        self.first = 0        # ring index of the top visible row
+        self.follow = True    # stick to the newest record while at the bottom
+        self.shown_first = 0  # absolute number of the record on the first Text line
+        self.shown = 0        # number of records in the Text widget
+        self.selection = None # ((row, col), (row, col)) in absolute rows, end exclusive
+        self._applied = None  # the "sel" range last set from self.selection, as Text indices
+
+        self.text = tk.Text(self, width=width, height=height, wrap=tk.NONE, state=tk.DISABLED)
+        self.vbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.hbar = tk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.config(xscrollcommand=self.hbar.set)
+
+        self.text.grid(row=0, column=0, sticky="nsew")
+        self.vbar.grid(row=0, column=1, sticky="ns")
+        self.hbar.grid(row=1, column=0, sticky="ew")
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self._linespace = tkfont.Font(font=self.text["font"]).metrics("linespace")
+
+        self.text.bind("<Configure>", self._on_resize)
+        self.text.bind("<MouseWheel>", self._on_wheel)
+        self.text.bind("<Button-4>", lambda e: self._scroll_by(-3))
+        self.text.bind("<Button-5>", lambda e: self._scroll_by(3))
+        self.text.bind("<Prior>", lambda e: self._scroll_by(-self.rows))
+        self.text.bind("<Next>", lambda e: self._scroll_by(self.rows))
+        self.text.bind("<Control-Home>", lambda e: self._scroll_to(0))
+        self.text.bind("<Control-End>", lambda e: self._scroll_to(len(self.records)))
+        # clicking gives focus so keyboard scrolling and <<Copy>> work on the visible rows
+        self.text.bind("<Button-1>", lambda e: self.text.focus_set(), add="+")
+        self.text.bind("<Shift-Button-1>", self._on_shift_click)
+        self.text.bind("<<Copy>>", self._on_copy)
+
+    def append(self, line):
+        self.append_many((line,))
+
+    def append_many(self, lines):
+        evicted = 0
+        for line in lines:
+            evicted += self.records.append(line)
+        if self.follow:
+            self.first = self._max_first()
+            self._render()
+        elif evicted:
+            # keep the same records on screen while older ones fall off the ring
+            self.first = max(0, self.first - evicted)
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def clear(self):
+        self.records.clear()
+        self.first = 0
+        self.follow = True
+        self.selection = None
+        self._render()
+
+    def at_bottom(self):
+        return self.first >= self._max_first()
+
+    def get_visible(self):
+        return self.records.slice(self.first, self.rows)
+
+    def _max_first(self):
+        return max(0, len(self.records) - self.rows)
+
+    def _scroll_to(self, first):
+        first = min(max(0, int(first)), self._max_first())
+        self.follow = first >= self._max_first()
+        if first != self.first:
+            self.first = first
+            self._render()
+        return "break"
+
+    def _scroll_by(self, n):
+        return self._scroll_to(self.first + n)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(amount) * len(self.records))
+        elif action == "scroll":
+            step = self.rows if unit == "pages" else 1
+            self._scroll_by(int(amount) * step)
+
+    def _on_wheel(self, event):
+        return self._scroll_by(-3 if event.delta > 0 else 3)
+
+    def _on_resize(self, event):
+        pad = 2 * (int(self.text["borderwidth"]) + int(self.text["highlightthickness"]) + int(self.text["pady"]))
+        rows = max(1, (event.height - pad) // self._linespace)
+        if rows != self.rows:
+            self.rows = rows
+            if self.follow:
+                self.first = self._max_first()
+            self._render()
+
+    def _render(self):
+        self._read_selection()
+        lines = self.get_visible()
+        new_first, n = self.records.dropped + self.first, len(lines)
+        old_first, old_n = self.shown_first, self.shown
+        keep_from, keep_to = max(old_first, new_first), min(old_first + old_n, new_first + n)
+        text = self.text
+        text.config(state=tk.NORMAL)
+        if keep_from < keep_to:
+            # only touch the rows leaving and entering the window
+            if keep_from > old_first:
+                text.delete("1.0", f"{keep_from - old_first + 1}.0")
+            if keep_to < old_first + old_n:
+                text.delete(f"{keep_to - keep_from}.end", "end-1c")
+            if new_first < keep_from:
+                text.insert("1.0", "\n".join(lines[:keep_from - new_first]) + "\n")
+            if keep_to < new_first + n:
+                text.insert("end-1c", "\n" + "\n".join(lines[keep_to - new_first:]))
+        else:
+            text.delete("1.0", tk.END)
+            text.insert("1.0", "\n".join(lines))
+        text.config(state=tk.DISABLED)
+        self.shown_first, self.shown = new_first, n
+        self._apply_selection()
+        self._update_scrollbar()
+
+    def _to_abs(self, index):
+        line, col = map(int, self.text.index(index).split("."))
+        return self.shown_first + line - 1, col
+
+    def _read_selection(self):
+        # the widget only holds the on-screen part of the selection; the saved range is
+        # kept unless the user has changed the selection since it was applied
+        ranges = self.text.tag_ranges("sel")
+        current = (str(ranges[0]), str(ranges[-1])) if ranges else None
+        if current == self._applied:
+            return
+        self.selection = (self._to_abs(current[0]), self._to_abs(current[1])) if current else None
+        self._applied = current
+
+    def _apply_selection(self):
+        self.text.tag_remove("sel", "1.0", tk.END)
+        self._applied = None
+        if self.selection is None or not self.shown:
+            return
+        (r0, c0), (r1, c1) = self.selection
+        lo, hi = self.shown_first, self.shown_first + self.shown
+        if r1 < lo or r0 >= hi:
+            return
+        start = self.text.index(f"{r0 - lo + 1}.{c0}" if r0 >= lo else "1.0")
+        end = self.text.index(f"{r1 - lo + 1}.{c1}" if r1 < hi else "end-1c")
+        self.text.tag_add("sel", start, end)
+        self._applied = (start, end)
+
+    def _on_shift_click(self, event):
+        self._read_selection()
+        if self.selection is None:
+            return None
+        pos = self._to_abs(f"@{event.x},{event.y}")
+        start, end = self.selection
+        self.selection = (pos, end) if pos < start else (start, pos)
+        self._apply_selection()
+        return "break"
+
+    def selected_text(self):
+        self._read_selection()
+        if self.selection is None:
+            return ""
+        (r0, c0), (r1, c1) = self.selection
+        base, n = self.records.dropped, len(self.records)
+        if r0 < base:
+            r0, c0 = base, 0
+        if r1 >= base + n:
+            r1, c1 = base + n - 1, None
+        lines = self.records.slice(r0 - base, r1 - r0 + 1)
+        if not lines:
+            return ""
+        lines[-1] = lines[-1][:c1]
+        lines[0] = lines[0][c0:]
+        return "\n".join(lines)
+
+    def _on_copy(self, event=None):
+        text = self.selected_text()
+        if not text:
+            return None
+        self.clipboard_clear()
+        self.clipboard_append(text)
+        return "break"
+
+    def _update_scrollbar(self):
+        n = len(self.records)
+        if n <= self.rows:
+            self.vbar.set(0.0, 1.0)
+        else:
+            self.vbar.set(self.first / n, min(1.0, (self.first + self.rows) / n))
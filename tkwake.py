@@ -0,0 +1,79 @@
+# tkwake.py
+# Event-driven wakeups of the Tk loop from other threads.
+#
+# A background thread calls TkWaker.wake(); the Tk thread runs the callback
+# once. The wakeup goes through a self-pipe registered with Tk's file-handler
+# mechanism, so an idle GUI does not poll at all, and wakeups are coalesced:
+# however many times wake() is called before the callback runs, it runs once.
+# Where Tk has no file handlers (Windows), it falls back to polling a flag.
+
+import os
+import threading
+import tkinter as tk
+
+FALLBACK_POLL_MS = 50
+
+
+class TkWaker:
+    def __init__(self, root, callback, fallback_poll_ms=FALLBACK_POLL_MS):
+        self.root = root
+        self.callback = callback
+        self.fallback_poll_ms = fallback_poll_ms
+        self._pending = False
+        self._lock = threading.Lock()
+        self._closed = False
+        self._rfd = self._wfd = None
+        try:
+            self._rfd, self._wfd = os.pipe()
+            os.set_blocking(self._rfd, False)
+            os.set_blocking(self._wfd, False)
+            root.tk.createfilehandler(self._rfd, tk.READABLE, self._on_readable)
+        except (AttributeError, OSError, tk.TclError):
+            self._close_pipe()
+            self._poll_id = root.after(fallback_poll_ms, self._poll)
+
+    def wake(self):
+        # safe to call from any thread
+        with self._lock:
+            if self._pending or self._closed:
+                return
+            self._pending = True
+        if self._wfd is not None:
+            try:
+                os.write(self._wfd, b"\0")
+            except (BlockingIOError, OSError):
+                pass
+
+    def _fire(self):
+        with self._lock:
+            self._pending = False
+        # cleared before the callback runs, so a wake() during it schedules another run
+        self.callback()
+
+    def _on_readable(self, fd, mask):
+        try:
+            os.read(self._rfd, 4096)
+        except (BlockingIOError, OSError):
+            pass
+        self._fire()
+
+    def _poll(self):
+        if self._pending:
+            self._fire()
+        if not self._closed:
+            self._poll_id = self.root.after(self.fallback_poll_ms, self._poll)
+
+    def _close_pipe(self):
+        for fd in (self._rfd, self._wfd):
+            if fd is not None:
+                os.close(fd)
+        self._rfd = self._wfd = None
+
+    def close(self):
+        self._closed = True
+        if self._rfd is not None:
+            try:
+                self.root.tk.deletefilehandler(self._rfd)
+            except tk.TclError:
+                pass
+            self._close_pipe()
@@ -0,0 +1,150 @@
+# topics.py
+# MQTT topic helpers shared by the broker, the loopback transport and the apps
+
+def valid_filter(topic_filter: str) -> bool:
+    if not topic_filter:
+        return False
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if "#" in level and (level != "#" or i != len(levels) - 1):
+            return False
+        if "+" in level and level != "+":
+            return False
+    return True
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    f = topic_filter.split("/")
+    t = topic.split("/")
+    # wildcards in the first level never match $SYS-style topics
+    if topic.startswith("$") and f[0] in ("+", "#"):
+        return False
+    for i, level in enumerate(f):
+        if level == "#":
+            return True
+        if i >= len(t):
+            return False
+        if level != "+" and level != t[i]:
+            return False
+    return len(f) == len(t)
+
+
+class _Node:
+    __slots__ = ("children", "filter", "value")
+
+    def __init__(self):
+        self.children = {}
+        self.filter = None   # set when a filter ends at this node
+        self.value = None
+
+
+class TopicTrie:
+    # Maps topic filters to values, one trie level per topic level. match() walks
+    # only the branches a topic can reach (its own levels, "+" and "#"), so its
+    # cost grows with the topic's depth rather than with the number of filters.
+    # Not thread-safe; callers sharing a trie across threads hold their own lock.
+    def __init__(self):
+        self.root = _Node()
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, topic_filter):
+        node = self._find(topic_filter)
+        return node is not None and node.filter is not None
+
+    def _find(self, topic_filter):
+        node = self.root
+        for level in topic_filter.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return None
+        return node
+
+    def insert(self, topic_filter, value=None):
+        if not valid_filter(topic_filter):
+            raise ValueError(f"invalid topic filter: {topic_filter!r}")
+        node = self.root
+        for level in topic_filter.split("/"):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        if node.filter is None:
+            self.count += 1
+        node.filter = topic_filter
+        node.value = value
+
+    def get(self, topic_filter, default=None):
+        node = self._find(topic_filter)
+        return node.value if node is not None and node.filter is not None else default
+
+    def remove(self, topic_filter):
+        # returns the removed value; raises KeyError for unknown filters
+        path = [self.root]
+        levels = topic_filter.split("/")
+        for level in levels:
+            node = path[-1].children.get(level)
+            if node is None:
+                raise KeyError(topic_filter)
+            path.append(node)
+        node = path[-1]
+        if node.filter is None:
+            raise KeyError(topic_filter)
+        value = node.value
+        node.filter = node.value = None
+        self.count -= 1
+        # prune branches left without filters
+        for level, parent in zip(reversed(levels), reversed(path[:-1])):
+            child = parent.children[level]
+            if child.children or child.filter is not None:
+                break
+            del parent.children[level]
+        return value
+
+    def filters(self):
+        out = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.filter is not None:
+                out.append(node.filter)
+            stack.extend(node.children.values())
+        return out
+
+    def match(self, topic):
+        # [(filter, value)] for every filter matching topic
+        out = []
+        levels = topic.split("/")
+        last = len(levels)
+        nodes = [self.root]
+        for i, level in enumerate(levels):
+            nxt = []
+            for node in nodes:
+                children = node.children
+                if not children:
+                    continue
+                # wildcards in the first level never match $SYS-style topics
+                wild = i > 0 or not level.startswith("$")
+                if wild:
+                    hash_node = children.get("#")
+                    if hash_node is not None and hash_node.filter is not None:
+                        out.append((hash_node.filter, hash_node.value))
+                    plus = children.get("+")
+                    if plus is not None:
+                        nxt.append(plus)
+                child = children.get(level)
+                if child is not None:
+                    nxt.append(child)
+            nodes = nxt
+            if not nodes:
+                return out
+        for node in nodes:
+            if node.filter is not None:
+                out.append((node.filter, node.value))
+            # "a/#" also matches "a" itself
+            hash_node = node.children.get("#")
+            if hash_node is not None and hash_node.filter is not None:
+                out.append((hash_node.filter, hash_node.value))
+        return out
@@ -0,0 +1,232 @@
+# transport.py
+# In-process loopback transport for tests and microbenchmarks.
+#
+# PublisherApp and SubscriberApp take a `client_factory(client_id, clean_session)`
+# instead of constructing mqtt.Client themselves. Anything it returns must provide
+# the subset of the paho-mqtt 1.6 client API the apps use:
+#   connect(host, port, keepalive), loop(timeout), loop_start(), loop_stop(), disconnect(),
+#   publish(topic, payload, qos=0, retain=False) -> info with .rc/.mid,
+#   subscribe(topic, qos=0) or subscribe([(topic, qos), ...]), unsubscribe(topic)
+#   or unsubscribe([topic, ...]), both -> (rc, mid), and the on_connect,
+#   on_disconnect, on_message, on_publish, on_subscribe, on_unsubscribe callback attributes.
+# LoopbackBus.client_factory hands out clients that exchange messages through
+# memory, synchronously on the publishing thread, with no sockets involved.
+# A client created with clean_session=False keeps its subscriptions across
+# disconnect/connect and reports "session present"; messages published while it
+# is disconnected are not queued for it.
+#
+# Run: python transport.py [count]   (quick loopback throughput check)
+
+import itertools
+import sys
+import threading
+import time
+
+from topics import topic_matches
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+
+class LoopbackMessage:
+    __slots__ = ("topic", "payload", "qos", "retain", "mid", "timestamp")
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+        self.timestamp = time.monotonic()
+
+
+class LoopbackMessageInfo:
+    __slots__ = ("rc", "mid")
+
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+    def is_published(self):
+        return self.rc == MQTT_ERR_SUCCESS
+
+    def wait_for_publish(self, timeout=None):
+        pass
+
+
+def _to_bytes(payload):
+    if payload is None:
+        return b""
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    return str(payload).encode("utf-8")
+
+
+class LoopbackBus:
+    # in-memory broker; clients created by client_factory talk only to each other
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = []
+        self.retained = {}
+
+    def client_factory(self, client_id, clean_session=True):
+        return LoopbackClient(self, client_id, clean_session)
+
+    def attach(self, client):
+        with self.lock:
+            if client not in self.clients:
+                self.clients = self.clients + [client]
+
+    def detach(self, client):
+        with self.lock:
+            self.clients = [c for c in self.clients if c is not client]
+
+    def route(self, topic, payload, qos, retain):
+        if retain:
+            with self.lock:
+                if payload:
+                    self.retained[topic] = (payload, qos)
+                else:
+                    self.retained.pop(topic, None)
+        # self.clients is replaced, never mutated, so it can be read without the lock
+        for client in self.clients:
+            sub_qos = client.match(topic)
+            if sub_qos >= 0:
+                client.deliver(LoopbackMessage(topic, payload, min(qos, sub_qos)))
+
+    def retained_for(self, topic_filter):
+        with self.lock:
+            items = list(self.retained.items())
+        return [(t, p, q) for t, (p, q) in items if topic_matches(topic_filter, t)]
+
+
+class LoopbackClient:
+    def __init__(self, bus, client_id="", clean_session=True):
+        self.bus = bus
+        self._client_id = client_id
+        self.clean_session = clean_session
+        self.subscriptions = {}   # filter -> qos
+        self.connected = False
+        self.session = False      # a session from an earlier connection is kept
+        self._mids = itertools.count(1)
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_subscribe = None
+        self.on_unsubscribe = None
+
+    # connection management
+
+    def connect(self, host=None, port=1883, keepalive=60):
+        if self.clean_session:
+            self.subscriptions = {}
+        present = 1 if self.session and not self.clean_session else 0
+        self.session = True
+        self.connected = True
+        self.bus.attach(self)
+        if self.on_connect:
+            self.on_connect(self, None, {"session present": present}, 0)
+        return MQTT_ERR_SUCCESS
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self):
+        if not self.connected:
+            return MQTT_ERR_NO_CONN
+        self.connected = False
+        self.bus.detach(self)
+        if self.on_disconnect:
+            self.on_disconnect(self, None, 0)
+        return MQTT_ERR_SUCCESS
+
+    def is_connected(self):
+        return self.connected
+
+    def loop(self, timeout=1.0, max_packets=1):
+        # delivery is synchronous, so there is no network work to do; just idle
+        if not self.connected:
+            return MQTT_ERR_NO_CONN
+        time.sleep(timeout)
+        return MQTT_ERR_SUCCESS if self.connected else MQTT_ERR_NO_CONN
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self, force=False):
+        pass
+
+    def max_inflight_messages_set(self, inflight):
+        pass
+
+    def max_queued_messages_set(self, queue_size):
+        pass
+
+    # messaging
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        mid = next(self._mids)
+        if not self.connected:
+            return LoopbackMessageInfo(MQTT_ERR_NO_CONN, mid)
+        self.bus.route(topic, _to_bytes(payload), qos, retain)
+        if self.on_publish:
+            self.on_publish(self, None, mid)
+        return LoopbackMessageInfo(MQTT_ERR_SUCCESS, mid)
+
+    def subscribe(self, topic, qos=0):
+        if not self.connected:
+            return MQTT_ERR_NO_CONN, None
+        pairs = topic if isinstance(topic, list) else [(topic, qos)]
+        mid = next(self._mids)
+        for topic_filter, q in pairs:
+            self.subscriptions[topic_filter] = q
+        if self.on_subscribe:
+            self.on_subscribe(self, None, mid, tuple(q for _, q in pairs))
+        for topic_filter, q in pairs:
+            for t, payload, retained_qos in self.bus.retained_for(topic_filter):
+                message = LoopbackMessage(t, payload, min(q, retained_qos))
+                message.retain = True
+                self.deliver(message)
+        return MQTT_ERR_SUCCESS, mid
+
+    def unsubscribe(self, topic):
+        if not self.connected:
+            return MQTT_ERR_NO_CONN, None
+        mid = next(self._mids)
+        for topic_filter in (topic if isinstance(topic, list) else [topic]):
+            self.subscriptions.pop(topic_filter, None)
+        if self.on_unsubscribe:
+            self.on_unsubscribe(self, None, mid)
+        return MQTT_ERR_SUCCESS, mid
+
+    def match(self, topic):
+        # highest granted QoS among matching filters, -1 if none match
+        qos = self.subscriptions.get(topic, -1)
+        for topic_filter, granted in self.subscriptions.items():
+            if granted > qos and topic_matches(topic_filter, topic):
+                qos = granted
+        return qos
+
+    def deliver(self, message):
+        if self.on_message:
+            self.on_message(self, None, message)
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    bus = LoopbackBus()
+    received = []
+    sub = bus.client_factory("sub")
+    sub.on_message = lambda client, userdata, msg: received.append(msg)
+    sub.connect()
+    sub.subscribe("twitter/test")
+    pub = bus.client_factory("pub")
+    pub.connect()
+    started = time.perf_counter()
+    for i in range(count):
+        pub.publish("twitter/test", b"anon_user: hello")
+    elapsed = time.perf_counter() - started
+    print(f"{len(received)} messages in {elapsed:.2f}s ({len(received) / elapsed:,.0f} msg/s)")
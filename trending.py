@@ -0,0 +1,146 @@
+# trending.py
+# Trending hashtags over a sliding time window in fixed memory.
+#
+# Counts go into a count-min sketch per time bucket. The buckets form a ring
+# covering the window, and an aggregate sketch holds their sum: adding a count
+# touches the current bucket and the aggregate, and a bucket that slides out of
+# the window is subtracted from the aggregate and zeroed. Estimates never
+# undercount, and overcount by at most a small share of the window's total.
+#
+# The heavy hitters are tracked in a bounded candidate set. A tag enters it when
+# its estimate beats the weakest candidate, and top() ranks only the candidates,
+# so refreshing the panel never rescans history. Memory depends only on the
+# sketch size and the candidate limit, not on the number of distinct tags.
+# Dependencies: none (stdlib only)
+
+import re
+import threading
+import time
+from array import array
+
+WINDOW_S = 300
+BUCKETS = 60
+WIDTH = 4096
+DEPTH = 4
+CANDIDATES = 256
+
+_HASHTAG_RE = re.compile(r"#(\w+)")
+
+
+def hashtags(topic, text):
+    # lowercased tags of one tweet: its topic (twitter/<tag>) and any #tags in the text
+    tags = {t.lower() for t in _HASHTAG_RE.findall(text)}
+    tail = topic.rsplit("/", 1)[-1]
+    if tail:
+        tags.add(tail.lower())
+    return tags
+
+
+class TrendTracker:
+    # add() runs on the MQTT network thread, top() on the Tk thread
+    def __init__(self, window_s=WINDOW_S, buckets=BUCKETS, width=WIDTH, depth=DEPTH,
+                 candidates=CANDIDATES, clock=time.monotonic):
+        self.bits = width.bit_length() - 1
+        if width != 1 << self.bits or depth * self.bits > 64:
+            raise ValueError("width must be a power of two with depth * log2(width) <= 64")
+        self.bucket_s = window_s / buckets
+        self.width = width
+        self.depth = depth
+        self.max_candidates = candidates
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.ring = [array("I", bytes(4 * width * depth)) for _ in range(buckets)]
+        self.aggregate = array("I", bytes(4 * width * depth))
+        self.totals = array("Q", bytes(8 * buckets))   # tags counted per bucket
+        self.current = int(clock() // self.bucket_s)    # absolute number of the newest bucket
+        self.candidates = {}                           # tag -> estimate when last seen
+        self.floor = 0                                 # smallest candidate estimate, once full
+
+    def _cells(self, tag):
+        # row i uses bits [i * b, (i + 1) * b) of the tag's 64-bit hash; rows derived
+        # from one hash by double hashing collide together far too often
+        h = hash(tag)
+        b = self.bits
+        mask = self.width - 1
+        return [i * self.width + ((h >> (i * b)) & mask) for i in range(self.depth)]
+
+    def _advance(self):
+        now = int(self.clock() // self.bucket_s)
+        steps = min(now - self.current, len(self.ring))
+        for n in range(self.current + 1, self.current + 1 + steps):
+            slot = n % len(self.ring)
+            old = self.ring[slot]
+            if self.totals[slot]:
+                agg = self.aggregate
+                for i, v in enumerate(old):
+                    if v:
+                        agg[i] -= v
+                self.ring[slot] = array("I", bytes(4 * self.width * self.depth))
+                self.totals[slot] = 0
+        if steps:
+            self.current = now
+            # estimates only shrink as buckets expire
+            self.floor = 0
+
+    def add(self, tags, n=1):
+        with self.lock:
+            self._advance()
+            slot = self.current % len(self.ring)
+            bucket = self.ring[slot]
+            agg = self.aggregate
+            for tag in tags:
+                estimate = None
+                for c in self._cells(tag):
+                    bucket[c] += n
+                    agg[c] += n
+                    v = agg[c]
+                    if estimate is None or v < estimate:
+                        estimate = v
+                self.totals[slot] += n
+                self._offer(tag, estimate)
+
+    def _offer(self, tag, estimate):
+        cands = self.candidates
+        if tag in cands or len(cands) < self.max_candidates:
+            cands[tag] = estimate
+            return
+        if estimate <= self.floor:
+            return
+        # refresh the weakest candidate's estimate before evicting it
+        weakest = min(cands, key=cands.get)
+        cands[weakest] = self._estimate(weakest)
+        weakest = min(cands, key=cands.get)
+        if estimate > cands[weakest]:
+            del cands[weakest]
+            cands[tag] = estimate
+        self.floor = min(cands.values())
+
+    def _estimate(self, tag):
+        agg = self.aggregate
+        return min(agg[c] for c in self._cells(tag))
+
+    def estimate(self, tag):
+        with self.lock:
+            self._advance()
+            return self._estimate(tag)
+
+    def total(self):
+        # tags counted inside the window
+        with self.lock:
+            self._advance()
+            return sum(self.totals)
+
+    def top(self, k=10):
+        # [(tag, estimated count)] for the k most frequent tags in the window
+        with self.lock:
+            self._advance()
+            ranked = []
+            for tag in list(self.candidates):
+                estimate = self._estimate(tag)
+                if estimate:
+                    self.candidates[tag] = estimate
+                    ranked.append((estimate, tag))
+                else:
+                    del self.candidates[tag]
+            ranked.sort(reverse=True)
+            return [(tag, count) for count, tag in ranked[:k]]
@@ -0,0 +1,365 @@
+# wire.py
+# Tweet payload encoding shared by publisher.py and subscriber.py
+#
+# Four payload formats are understood, told apart by their first byte:
+#
+#   binary (current)  0xF7 <version> <kind> ...      see encode_tweet / encode_batch
+#   JSON envelope     0x1E <json meta> "\n" <body>   (older publishers)
+#   JSON batch        0x1D <json list of payloads>   (older publishers)
+#   legacy text       "username: message"            (anything else)
+#
+# 0xF7 never starts a valid UTF-8 string, so binary payloads cannot be mistaken
+# for text ones.
+#
+# Binary layout, all integers are unsigned LEB128 varints:
+#
+#   tweet message       F7 01 01 <tweet body>
+#   batch message       F7 01 02 <count> (<length> <tweet body>) * count
+#   compressed message  F7 01 03 <dictionary id> <raw deflate of a tweet or batch message>
+#   tweet body          <len> username  <len> text  (<tag> <len> value) *
+#
+# Optional fields are tag/length/value so a decoder skips tags it does not know;
+# an empty username means the sender did not split the author from the text.
+# The send time goes out as a fixed 8-byte field (F_SENT_NS64): decoding a
+# 9-byte varint byte by byte cost more than the rest of the tweet together.
+# The varint form (F_SENT_NS) from earlier publishers is still decoded.
+#
+# Compression uses zlib with a preset dictionary trained on tweets (see
+# dicttool.py). The dictionary ID is the CRC-32 of its contents, so it is stable
+# across machines; ID 0 means plain deflate without a dictionary.
+
+import glob
+import json
+import os
+import time
+import zlib
+from collections import namedtuple
+
+MAGIC = 0xF7
+VERSION = 1
+KIND_TWEET = 1
+KIND_BATCH = 2
+KIND_COMPRESSED = 3
+
+# optional field tags
+F_SENT_NS = 1        # varint, time.time_ns() at the publisher
+F_PUBLISHER_ID = 2   # utf-8
+F_SEQ = 3            # varint, per-publisher sequence number
+F_MSG_ID = 4         # raw bytes, publisher-assigned unique message ID
+F_SENT_NS64 = 5      # 8 bytes little-endian, time.time_ns() at the publisher
+
+_TWEET_HEADER = bytes((MAGIC, VERSION, KIND_TWEET))
+_BATCH_HEADER = bytes((MAGIC, VERSION, KIND_BATCH))
+_COMPRESSED_HEADER = bytes((MAGIC, VERSION, KIND_COMPRESSED))
+_SENT_NS64_FIELD = bytes((F_SENT_NS64, 8))
+_tuple_new = tuple.__new__
+
+# publisher ID -> its encoded field; a publisher sends the same one with every tweet
+_publisher_fields = {}
+
+DICT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dicts")
+COMPRESS_LEVEL = 9
+# refuse to inflate a single message beyond this many bytes
+MAX_DECOMPRESSED = 1024 * 1024
+
+# dictionary ID -> dictionary bytes
+_dictionaries = {}
+# dictionary ID -> compressobj primed with that dictionary, copied per message:
+# priming a level 9 compressor costs more than compressing a tweet with it
+_compressors = {}
+
+# A payload starting with this marker carries a JSON metadata header on its first
+# line, followed by the legacy "username: message" body.
+ENVELOPE_MARKER = "\x1e"
+
+# A payload starting with this marker is a JSON list of individual payloads.
+BATCH_MARKER = "\x1d"
+
+
+class WireError(ValueError):
+    pass
+
+
+class UnknownDictionaryError(WireError):
+    # the payload was compressed with a dictionary this machine does not have
+    def __init__(self, dict_id):
+        super().__init__(f"unknown dictionary {dict_id:#x}")
+        self.dict_id = dict_id
+
+
+class Tweet(namedtuple("Tweet", "username text sent_ns publisher_id seq msg_id",
+                       defaults=(None, None, None, None))):
+    __slots__ = ()
+
+    def display(self):
+        if self.username:
+            return f"{self.username}: {self.text}"
+        return self.text
+
+
+def _varint(n):
+    if n < 0x80:
+        return bytes((n,))
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _read_varint(buf, pos):
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+        if shift > 70:
+            raise WireError("varint too long")
+
+
+def _publisher_field(publisher_id):
+    field = _publisher_fields.get(publisher_id)
+    if field is None:
+        v = publisher_id.encode("utf-8")
+        field = bytes((F_PUBLISHER_ID,)) + _varint(len(v)) + v
+        if len(_publisher_fields) >= 1024:
+            _publisher_fields.clear()
+        _publisher_fields[publisher_id] = field
+    return field
+
+
+def _tweet_body(username, text, sent_ns=None, publisher_id=None, seq=None, msg_id=None):
+    u = username.encode("utf-8") if username else b""
+    t = text.encode("utf-8")
+    parts = [_varint(len(u)), u, _varint(len(t)), t]
+    if sent_ns is not None:
+        parts += (_SENT_NS64_FIELD, sent_ns.to_bytes(8, "little"))
+    if publisher_id is not None:
+        parts.append(_publisher_field(publisher_id))
+    if seq is not None:
+        v = _varint(seq)
+        parts += (bytes((F_SEQ, len(v))), v)
+    if msg_id is not None:
+        parts += (bytes((F_MSG_ID,)), _varint(len(msg_id)), msg_id)
+    return b"".join(parts)
+
+
+def encode_tweet(username, text, sent_ns=None, publisher_id=None, seq=None, msg_id=None) -> bytes:
+    return _TWEET_HEADER + _tweet_body(username, text, sent_ns, publisher_id, seq, msg_id)
+
+
+def encode_batch(payloads) -> bytes:
+    # payloads may be binary tweets or any of the text formats; text ones are converted
+    bodies = []
+    for payload in payloads:
+        if isinstance(payload, (bytes, bytearray)) and payload[:3] == _TWEET_HEADER:
+            bodies.append(bytes(payload[3:]))
+            continue
+        for tweet in decode(payload if isinstance(payload, (bytes, bytearray)) else payload.encode("utf-8")):
+            bodies.append(_tweet_body(*tweet))
+    parts = [_BATCH_HEADER, _varint(len(bodies))]
+    for body in bodies:
+        parts += (_varint(len(body)), body)
+    return b"".join(parts)
+
+
+def _decode_body(buf, pos, end):
+    # hot path: lengths below 128 are read inline, only longer ones go through _read_varint
+    n = buf[pos]
+    if n < 0x80:
+        pos += 1
+    else:
+        n, pos = _read_varint(buf, pos)
+    username = buf[pos:pos + n].decode("utf-8") if n else None
+    pos += n
+    n = buf[pos]
+    if n < 0x80:
+        pos += 1
+    else:
+        n, pos = _read_varint(buf, pos)
+    text = buf[pos:pos + n].decode("utf-8")
+    pos += n
+    sent_ns = publisher_id = seq = msg_id = None
+    while pos < end:
+        tag = buf[pos]
+        n = buf[pos + 1]
+        if n < 0x80:
+            pos += 2
+        else:
+            n, pos = _read_varint(buf, pos + 1)
+        nxt = pos + n
+        if tag == F_SENT_NS64:
+            sent_ns = int.from_bytes(buf[pos:nxt], "little")
+        elif tag == F_PUBLISHER_ID:
+            publisher_id = buf[pos:nxt].decode("utf-8")
+        elif tag == F_SEQ:
+            seq = buf[pos] if buf[pos] < 0x80 else _read_varint(buf[pos:nxt], 0)[0]
+        elif tag == F_MSG_ID:
+            msg_id = bytes(buf[pos:nxt])
+        elif tag == F_SENT_NS:
+            sent_ns = _read_varint(buf[pos:nxt], 0)[0]
+        # unknown tags are skipped
+        pos = nxt
+    if pos != end:
+        raise WireError("field overruns tweet")
+    return _tuple_new(Tweet, (username, text, sent_ns, publisher_id, seq, msg_id))
+
+
+def _decode_binary(buf):
+    if len(buf) < 3:
+        raise WireError("short header")
+    if buf[1] != VERSION:
+        raise WireError(f"unsupported version {buf[1]}")
+    kind = buf[2]
+    if kind == KIND_TWEET:
+        return [_decode_body(buf, 3, len(buf))]
+    if kind == KIND_BATCH:
+        count, pos = _read_varint(buf, 3)
+        tweets = []
+        for _ in range(count):
+            n, pos = _read_varint(buf, pos)
+            if pos + n > len(buf):
+                raise WireError("truncated batch")
+            tweets.append(_decode_body(buf, pos, pos + n))
+            pos += n
+        return tweets
+    if kind == KIND_COMPRESSED:
+        dict_id, pos = _read_varint(buf, 3)
+        return _decode_binary(_inflate(buf[pos:], dict_id))
+    raise WireError(f"unknown kind {kind}")
+
+
+def dictionary_id(data: bytes) -> int:
+    return zlib.crc32(data) or 1
+
+
+def register_dictionary(data: bytes) -> int:
+    dict_id = dictionary_id(data)
+    _dictionaries[dict_id] = data
+    _compressors.pop(dict_id, None)
+    return dict_id
+
+
+def load_dictionaries(path=DICT_DIR):
+    # registers every *.zdict file in path; returns the ID of the newest one (by
+    # version in the file name, see dicttool.py), or None when there are none
+    newest = None
+    for filename in sorted(glob.glob(os.path.join(path, "*.zdict"))):
+        with open(filename, "rb") as f:
+            newest = register_dictionary(f.read())
+    return newest
+
+
+def compress(payload: bytes, dict_id=0) -> bytes:
+    # wraps a binary tweet or batch message; returns it unchanged when compression does not pay off
+    primed = _compressors.get(dict_id)
+    if primed is None:
+        if dict_id:
+            primed = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15, zdict=_dictionaries[dict_id])
+        else:
+            primed = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        _compressors[dict_id] = primed
+    c = primed.copy()
+    body = c.compress(payload) + c.flush()
+    header = _COMPRESSED_HEADER + _varint(dict_id)
+    if len(header) + len(body) >= len(payload):
+        return payload
+    return header + body
+
+
+def _inflate(data, dict_id):
+    if dict_id:
+        zdict = _dictionaries.get(dict_id)
+        if zdict is None:
+            raise UnknownDictionaryError(dict_id)
+        d = zlib.decompressobj(-15, zdict=zdict)
+    else:
+        d = zlib.decompressobj(-15)
+    try:
+        out = d.decompress(bytes(data), MAX_DECOMPRESSED)
+    except zlib.error as e:
+        raise WireError(str(e))
+    if d.unconsumed_tail:
+        raise WireError("decompressed message too large")
+    if out[:3] == _COMPRESSED_HEADER:
+        raise WireError("nested compression")
+    return out
+
+
+def decode(payload: bytes):
+    # returns a list of Tweet, one per tweet carried by the payload; malformed
+    # binary payloads decode to an empty list
+    try:
+        return decode_strict(payload)
+    except WireError:
+        return []
+
+
+def decode_strict(payload: bytes):
+    # like decode(), but a malformed binary payload raises WireError
+    # (UnknownDictionaryError when only its compression dictionary is missing)
+    if payload[:1] == b"\xf7":
+        try:
+            return _decode_binary(payload)
+        except (IndexError, UnicodeDecodeError) as e:
+            raise WireError(f"malformed payload: {e}")
+    text = payload.decode("utf-8", errors="ignore")
+    return [_from_text(body, meta) for body, meta in decode_entries(text)]
+
+
+def _from_text(body, meta):
+    if not meta:
+        return Tweet(None, body)
+    ints = [v if isinstance(v, int) else None for v in (meta.get("ts"), meta.get("seq"))]
+    pid = meta.get("pid")
+    return Tweet(None, body, ints[0], pid if isinstance(pid, str) else None, ints[1])
+
+
+# text formats, kept so payloads from older publishers still decode
+
+
+def encode_envelope(body: str, publisher_id: str, sent_ns=None, seq=None) -> str:
+    meta = {
+        "v": 1,
+        "ts": time.time_ns() if sent_ns is None else sent_ns,
+        "pid": publisher_id,
+    }
+    # per-publisher sequence number, lets consumers detect lost messages
+    if seq is not None:
+        meta["seq"] = seq
+    return ENVELOPE_MARKER + json.dumps(meta, separators=(",", ":")) + "\n" + body
+
+
+def decode_payload(payload: str):
+    # returns (body, meta); meta is None for legacy or malformed payloads
+    if not payload.startswith(ENVELOPE_MARKER):
+        return payload, None
+    header, _, body = payload[1:].partition("\n")
+    try:
+        meta = json.loads(header)
+    except ValueError:
+        return payload, None
+    if not isinstance(meta, dict):
+        return payload, None
+    return body, meta
+
+
+def decode_entries(payload: str):
+    # returns a list of (body, meta), one per tweet; plain payloads give a single entry
+    if payload.startswith(BATCH_MARKER):
+        try:
+            items = json.loads(payload[1:])
+        except ValueError:
+            return [(payload, None)]
+        if isinstance(items, list):
+            return [decode_payload(item) for item in items if isinstance(item, str)]
+        return [(payload, None)]
+    return [decode_payload(payload)]